@@ -1,21 +1,61 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
-import json
-from typing import List, Optional, Dict, Any
-from pydantic import BaseModel
+from typing import Callable, List, Optional, Dict, Any, Tuple
+from pydantic import BaseModel, Field
 from enum import Enum
-from utils import format_product_display, format_user_display
+from utils import format_product_display, format_product_fields, format_user_display, get_rendition, prefetch_rendition, rendition_cache
+from renditions import FORMAT_MEDIA_TYPES, RENDITION_PROFILES, negotiate_image_format, profile_for_width
+from catalog import (
+    CatalogStore, CatalogSnapshot, ProductTable, SORTABLE_FIELDS, encode_cursor, decode_cursor,
+    normalize_value, stock_status
+)
+from cache import LRUCache, VersionedCache
+from compression import COMPRESS_FAST_SIZE, COMPRESS_MIN_SIZE, compress, negotiate_encoding
+from concurrency import BoundedExecutor, Overloaded, SingleFlight
+from image_manifest import ASSETS_PREFIX, IMMUTABLE_CACHE_CONTROL
+from inventory import Inventory, InventoryUnavailable
+from prefetch import Prefetcher
+from serialization import encode_json
+from http_cache import (
+    CATALOG_CACHE_CONTROL, USER_CACHE_CONTROL, file_version, is_not_modified,
+    make_etag, not_modified, validator_headers
+)
 from collections import defaultdict
+from contextlib import asynccontextmanager
+import functools
+from pathlib import Path
 from datetime import datetime
 import os
 
+# Both databases are loaded once and served from memory
+catalog = CatalogStore()
+
+# Stock changes, logged before they are acknowledged and periodically
+# compacted into the product database
+inventory = Inventory(catalog)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the catalog before accepting requests
+    catalog.reload()
+    catalog.start()
+    prefetcher.start()
+    inventory.start()
+    yield
+    await inventory.stop()
+    await prefetcher.stop()
+    catalog.stop()
+    for pool in image_pools.values():
+        pool.shutdown()
+
 app = FastAPI(
     title="Fashionary API",
     description="API for managing e-commerce products with sorting capabilities",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Enable CORS
@@ -25,6 +65,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let browser clients read the pagination and caching headers
+    expose_headers=["X-Total-Count", "X-Next-Cursor", "ETag"],
 )
 
 # Mount static files
@@ -33,6 +75,75 @@ app.mount("/images", StaticFiles(directory="../images"), name="images")
 # Templates
 templates = Jinja2Templates(directory="templates")
 
+# Niceness of the image worker threads: the event loop serving the cheap
+# JSON routes gets the CPU first when image work saturates it
+IMAGE_WORKER_NICE = int(os.environ.get("IMAGE_WORKER_NICE", "10"))
+
+# Seconds clients are asked to wait before retrying a shed image request
+OVERLOAD_RETRY_AFTER = os.environ.get("OVERLOAD_RETRY_AFTER", "1")
+
+def image_pool(route_class: str, max_workers: int, max_queue: int, max_wait: float) -> BoundedExecutor:
+    """Create the image pool of a route class, with limits overridable by <CLASS>_* variables"""
+    prefix = route_class.upper()
+    return BoundedExecutor(
+        max_workers=int(os.environ.get(f"{prefix}_WORKERS", str(max_workers))),
+        max_queue=int(os.environ.get(f"{prefix}_QUEUE_DEPTH", str(max_queue))),
+        max_wait=float(os.environ.get(f"{prefix}_MAX_WAIT", str(max_wait))),
+        nice=IMAGE_WORKER_NICE,
+        name=route_class
+    )
+
+# Image decoding and encoding is blocking, CPU-bound work: it runs on
+# bounded pools so the event loop keeps serving the other endpoints. Each
+# route class has its own pool and queue, so a surge of one cannot starve
+# the other, and requests beyond the queue are rejected right away
+image_pools = {
+    # JSON display routes with inline images, up to a page of images each;
+    # the queue counts images, so it holds about one full page
+    "display": image_pool("display", min(2, os.cpu_count() or 1), 128, 2.0),
+    # Binary renditions of the /image endpoints, mostly cache hits
+    "image": image_pool("image", min(4, os.cpu_count() or 1), 32, 2.0)
+}
+
+# Concurrent requests for the same image work share one computation,
+# keyed by the ETag of the response being computed
+single_flight = SingleFlight()
+
+# Renditions clients are likely to request next are loaded into the
+# rendition cache in the background, whenever the image pools are idle
+prefetcher = Prefetcher(
+    warm=prefetch_rendition,
+    busy=lambda: any(pool.pending for pool in image_pools.values()),
+    max_queue=int(os.environ.get("PREFETCH_QUEUE_DEPTH", "256")),
+    nice=IMAGE_WORKER_NICE
+)
+
+# Accept header assumed for prefetched renditions of linked images, which
+# browsers request themselves (inline images are always JPEG)
+PREFETCH_ACCEPT = os.environ.get("PREFETCH_ACCEPT", "image/avif,image/webp")
+
+# Largest page size accepted by the paginated listings
+MAX_PAGE_SIZE = 1000
+
+# Most products formatted for display in one batch request
+MAX_DISPLAY_BATCH = 100
+
+# Encoded listing results, keyed by normalized query parameters and only
+# valid for the product data version they were computed from
+result_cache = VersionedCache(
+    max_entries=int(os.environ.get("RESULT_CACHE_ENTRIES", "256")),
+    max_bytes=int(os.environ.get("RESULT_CACHE_BYTES", str(64 * 1024 * 1024))),
+    sizeof=lambda entry: len(entry[0])
+)
+
+# Compressed response bodies, keyed by (ETag, content coding). ETags change
+# with the data version, so each representation is compressed once per
+# version and entries of older versions simply age out
+compressed_cache = LRUCache(
+    max_entries=int(os.environ.get("COMPRESSED_CACHE_ENTRIES", "1024")),
+    max_bytes=int(os.environ.get("COMPRESSED_CACHE_BYTES", str(64 * 1024 * 1024)))
+)
+
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     """
@@ -44,9 +155,20 @@ class SortOrder(str, Enum):
     ASC = "asc"
     DESC = "desc"
 
+class DisplayImage(str, Enum):
+    INLINE = "inline"
+    URL = "url"
+
+class StockStatus(str, Enum):
+    IN_STOCK = "in_stock"
+    LOW_STOCK = "low_stock"
+    OUT_OF_STOCK = "out_of_stock"
+
 class Product(BaseModel):
     id: str
     image_path: str
+    image_src: Optional[str] = None
+    image_placeholder: Optional[str] = None
     description: str
     type: str
     color: str
@@ -58,7 +180,9 @@ class Product(BaseModel):
 
 class ProductDisplay(BaseModel):
     id: str
-    image: str
+    # None when a listed product's image cannot be processed
+    image: Optional[str] = None
+    placeholder: Optional[str] = None
     description: str
     type: str
     color: str
@@ -69,6 +193,34 @@ class ProductDisplay(BaseModel):
     created_at: str
     stock_status: str
 
+class StockAdjustment(BaseModel):
+    delta: int
+
+class StockQuantity(BaseModel):
+    quantity: int = Field(gt=0)
+
+class StockUpdate(BaseModel):
+    id: str
+    stock: int
+    stock_status: str
+    seq: int
+
+class UserPageCartItem(BaseModel):
+    product_id: str
+    quantity: int
+    added_at: str
+    product: Optional[ProductDisplay]
+
+class UserPageCart(BaseModel):
+    items: List[UserPageCartItem]
+    total_items: int
+    total_price: float
+
+class UserPage(BaseModel):
+    user: Dict[str, Any]
+    purchases: List[ProductDisplay]
+    cart: UserPageCart
+
 class Metadata(BaseModel):
     total_products: int
     types: Dict[str, int]
@@ -76,12 +228,32 @@ class Metadata(BaseModel):
     stock_stats: Dict[str, float]
     generated_at: str
 
+class PriceBucket(BaseModel):
+    min: float
+    max: float
+    count: int
+
+class ProductFacets(BaseModel):
+    total: int
+    types: Dict[str, int]
+    colors: Dict[str, int]
+    stock_status: Dict[str, int]
+    price_buckets: List[PriceBucket]
+
+class Suggestion(BaseModel):
+    text: str
+    field: str
+    purchases: int
+    products: int
+
 class User(BaseModel):
     id: str
     name: str
     description: str
     style_preferences: List[str]
     image_url: str
+    image_src: Optional[str] = None
+    image_placeholder: Optional[str] = None
     purchase_history: List[str]
     cart_status: Dict[str, Any]
     created_at: str
@@ -91,68 +263,638 @@ class UserMetadata(BaseModel):
     generated_at: str
     stats: Dict[str, Any]
 
-def load_products(db_path: str = "../db/product_database.json", data_field: str = "products"):
+def get_catalog() -> CatalogSnapshot:
+    """Get the current in-memory catalog snapshot"""
     try:
-        with open(db_path, "r") as f:
-            data = json.load(f)
-            return data[data_field]
+        return catalog.snapshot()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error loading products: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error loading catalog: {str(e)}")
+
+def json_response(body: bytes, headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Send already encoded JSON.
+
+    Routes that return catalog records directly skip FastAPI's response
+    model validation and serialization; the response_model on the route
+    still documents the schema.
+    """
+    return Response(content=body, media_type="application/json", headers=headers)
 
-def load_users(db_path: str = "../db/users_database.json", data_field: str = "users"):
-    """Load users from the database"""
+async def compressed_body(etag: str, encoding: str, body: bytes) -> Optional[bytes]:
+    """
+    Get the compressed variant of a response body, compressing it on a cache miss.
+
+    Bodies of COMPRESS_FAST_SIZE or more (e.g. with inline images) are
+    compressed on the display image pool, so they never stall the event
+    loop, and concurrent requests for the same variant share the work.
+
+    Returns:
+        The compressed body, or None when the pool is saturated and the
+        body should be sent uncompressed
+    """
+    key = (etag, encoding)
+    compressed = compressed_cache.get(key)
+    if compressed is None:
+        if len(body) < COMPRESS_FAST_SIZE:
+            compressed = compress(body, encoding)
+        else:
+            try:
+                compressed = await single_flight.run(
+                    ("compress", etag, encoding),
+                    lambda: image_pools["display"].run(compress, body, encoding)
+                )
+            except Overloaded:
+                return None
+        compressed_cache.set(key, compressed)
+    return compressed
+
+async def conditional_json_response(
+    request: Request,
+    etag: str,
+    cache_control: str,
+    compute: Callable[[], Tuple[bytes, Dict[str, str]]]
+) -> Response:
+    """
+    Serve encoded JSON with validators, or 304 when the client's copy is current.
+
+    The body is compressed with the best coding the client accepts; the
+    compressed bytes are cached per ETag, so hot responses are compressed
+    once rather than on every request.
+
+    Args:
+        request: Incoming request, checked for If-None-Match
+        etag: ETag of the current representation
+        cache_control: Cache-Control header value
+        compute: Function returning (encoded body, response headers); not
+            called when a 304 is sent
+
+    Returns:
+        JSON response, or an empty 304 Not Modified response
+    """
+    vary = {"Vary": "Accept-Encoding"}
+    if is_not_modified(request, etag):
+        return not_modified(etag, cache_control, vary)
+    body, headers = compute()
+    headers = {**headers, **validator_headers(etag, cache_control), **vary}
+
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding is not None and len(body) >= COMPRESS_MIN_SIZE:
+        compressed = await compressed_body(etag, encoding, body)
+        if compressed is not None and len(compressed) < len(body):
+            body = compressed
+            headers["Content-Encoding"] = encoding
+            # Byte-wise the variant differs from the identity body
+            headers["ETag"] = f"W/{etag}"
+    return json_response(body, headers)
+
+def overloaded() -> HTTPException:
+    """Build the 503 response of a shed image request"""
+    return HTTPException(
+        status_code=503,
+        detail="Too many image requests in progress, retry shortly",
+        headers={"Retry-After": OVERLOAD_RETRY_AFTER}
+    )
+
+async def run_image_task(route_class: str, func: Callable[..., Any], *args: Any) -> Any:
+    """
+    Run blocking image work on the image pool of a route class.
+
+    Raises:
+        HTTPException: 503 with Retry-After when the pool is saturated
+    """
     try:
-        with open(db_path, "r") as f:
-            data = json.load(f)
-            return data[data_field]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error loading users: {str(e)}")
+        return await image_pools[route_class].run(func, *args)
+    except Overloaded:
+        raise overloaded()
+
+async def run_image_batch(route_class: str, func: Callable[[Any], Any], items: List[Any]) -> List[Any]:
+    """
+    Run blocking image work over several items concurrently on the image pool of a route class.
+
+    Raises:
+        HTTPException: 503 with Retry-After when the pool is saturated
+    """
+    try:
+        return await image_pools[route_class].map(func, items)
+    except Overloaded:
+        raise overloaded()
+
+async def pooled_json_response(
+    request: Request,
+    etag: str,
+    cache_control: str,
+    compute: Callable[[], Tuple[bytes, Dict[str, str]]]
+) -> Response:
+    """
+    Like conditional_json_response, but run a blocking compute on the display image pool.
+
+    Concurrent requests for the same ETag share a single computation.
+
+    Raises:
+        HTTPException: 503 with Retry-After when the display pool is saturated
+    """
+    if is_not_modified(request, etag):
+        return await conditional_json_response(request, etag, cache_control, compute)
+    entry = await single_flight.run(etag, lambda: run_image_task("display", compute))
+    return await conditional_json_response(request, etag, cache_control, lambda: entry)
+
+async def image_response(
+    request: Request,
+    image_path: Path,
+    kind: str,
+    width: Optional[int],
+    cache_control: str,
+    version: Optional[str] = None
+) -> Response:
+    """
+    Serve a binary image rendition, negotiating its format from Accept.
+
+    Args:
+        request: Incoming request
+        image_path: Path of the source image
+        kind: Image directory, "products" or "users"
+        width: Requested width in pixels, snapped to a rendition profile
+        cache_control: Cache-Control header value
+        version: Content digest the client asked for; when it matches the
+            image's, the URL names this content for good and is cached as immutable
+
+    Returns:
+        Image response, or an empty 304 Not Modified response
+    """
+    if version is not None and version == catalog.images.digest(str(image_path)):
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    profile = profile_for_width(kind, width)
+    format = negotiate_image_format(request.headers.get("accept"), profile)
+    etag = make_etag("image", str(image_path), file_version(str(image_path)), profile, format)
+    vary = {"Vary": "Accept"}
+    if is_not_modified(request, etag):
+        return not_modified(etag, cache_control, vary)
+    if not image_path.exists():
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    data = await single_flight.run(etag, lambda: run_image_task("image", get_rendition, image_path, profile, format))
+    return Response(
+        content=data,
+        media_type=FORMAT_MEDIA_TYPES[format],
+        headers={**validator_headers(etag, cache_control), **vary}
+    )
+
+async def cached_json_response(
+    request: Request,
+    key: Tuple,
+    version: str,
+    compute: Callable[[], Tuple[bytes, Dict[str, str]]]
+) -> Response:
+    """
+    Serve an encoded JSON result from the result cache, computing it on a miss.
+
+    The ETag is derived from the data version and the normalized query, so
+    a revalidation is answered without looking at the result at all.
+
+    Args:
+        request: Incoming request
+        key: Normalized query parameters identifying the result
+        version: Data version the result is computed from
+        compute: Function returning (encoded body, response headers)
+
+    Returns:
+        JSON response with the cached body and headers, or 304 Not Modified
+    """
+    def cached() -> Tuple[bytes, Dict[str, str]]:
+        entry = result_cache.get_versioned(key, version)
+        if entry is None:
+            entry = compute()
+            result_cache.set_versioned(key, entry, version)
+        return entry
+
+    etag = make_etag(version, repr(key))
+    return await conditional_json_response(request, etag, CATALOG_CACHE_CONTROL, cached)
+
+# Width of the product thumbnails in composite responses
+THUMBNAIL_WIDTH = RENDITION_PROFILES["grid"]["max_size"]
+
+def image_endpoint_url(path: str, image_path: str, width: Optional[int] = None) -> str:
+    """Build an /image endpoint URL, versioned with the image's content digest when known"""
+    params = []
+    if width is not None:
+        params.append(f"w={width}")
+    digest = catalog.images.digest(image_path)
+    if digest is not None:
+        params.append(f"v={digest}")
+    return f"{path}?{'&'.join(params)}" if params else path
+
+def product_display_version(table: ProductTable, product: Dict[str, Any], image: DisplayImage) -> str:
+    """Get the parts of a product display's ETag: its record and, when embedded, its image file"""
+    digest = table.encoded.digest(product)
+    if image == DisplayImage.URL:
+        return digest
+    return f"{digest}:{file_version('../' + product['image_path'])}"
+
+def product_display_entry(
+    product: Dict[str, Any],
+    image: DisplayImage,
+    thumbnail: bool = False,
+    listed: bool = False
+) -> Dict[str, Any]:
+    """
+    Format a product for display (blocking when the image is embedded).
+
+    Args:
+        product: Product to format
+        image: Whether to embed the image or link it
+        thumbnail: Use the grid thumbnail instead of the full image
+        listed: The product is one of many in a response, so an image that
+            cannot be processed leaves its image null instead of failing
+            the whole response
+
+    Raises:
+        HTTPException: 500 if the product's image cannot be processed and
+            it is not listed
+    """
+    image_url = None
+    if image == DisplayImage.URL:
+        image_url = image_endpoint_url(
+            f"/products/{product['id']}/image", f"../{product['image_path']}",
+            THUMBNAIL_WIDTH if thumbnail else None
+        )
+    formatted_product = format_product_display(product, image_url, "grid" if thumbnail else "detail")
+    if "error" in formatted_product and listed:
+        print(f"Listing product {product['id']} without its image: {formatted_product['error']}")
+        formatted_product = {"image": None, **format_product_fields(product)}
+    elif "error" in formatted_product:
+        raise HTTPException(
+            status_code=500,
+            detail=formatted_product["error"]
+        )
+    # Encoded directly, so project onto the response model by hand
+    return {field: formatted_product[field] for field in ProductDisplay.model_fields}
+
+def user_display_version(snapshot: CatalogSnapshot, user: Dict[str, Any], image: DisplayImage) -> str:
+    """Get the parts of a user display's ETag: its record and, when embedded, its image file"""
+    digest = snapshot.users.encoded.digest(user)
+    if image == DisplayImage.URL:
+        return digest
+    return f"{digest}:{file_version('../' + user['image_url'])}"
+
+def user_display_entry(user: Dict[str, Any], image: DisplayImage) -> Dict[str, Any]:
+    """
+    Format a user for display (blocking when the image is embedded).
+
+    Raises:
+        HTTPException: 500 if the user's image cannot be processed
+    """
+    image_url = None
+    if image == DisplayImage.URL:
+        image_url = image_endpoint_url(f"/users/{user['id']}/image", f"../{user['image_url']}")
+    formatted_user = format_user_display(user, image_url)
+    if "error" in formatted_user:
+        raise HTTPException(
+            status_code=500,
+            detail=formatted_user["error"]
+        )
+    return formatted_user
+
+def prefetch_product_images(products: List[Dict[str, Any]], image: DisplayImage, profile: str = "detail"):
+    """Queue the renditions of products a client is likely to display next"""
+    if image == DisplayImage.INLINE:
+        format = "JPEG"
+    else:
+        format = negotiate_image_format(PREFETCH_ACCEPT, profile)
+    prefetcher.submit((Path(f"../{product['image_path']}"), profile, format) for product in products)
+
+def prefetch_user_products(snapshot: CatalogSnapshot, user: Dict[str, Any], image: DisplayImage):
+    """Queue the images of the products in a user's cart and purchase history"""
+    cart_products = [item["product"] for item in snapshot.user_cart_items(user) if item["product"] is not None]
+    prefetch_product_images(cart_products + snapshot.user_purchases(user), image)
+
+def get_user_or_404(snapshot: CatalogSnapshot, user_id: str) -> Dict[str, Any]:
+    """Look up a user by id or short id, raising a 404 if it does not exist"""
+    user = snapshot.users.get(user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+def product_filters(
+    type: Optional[List[str]] = Query(None, description="Product type(s), e.g. scarf"),
+    color: Optional[List[str]] = Query(None, description="Product color(s), e.g. black"),
+    graphic: Optional[List[str]] = Query(None, description="Graphic design(s)"),
+    stock_status: Optional[List[StockStatus]] = Query(None, description="Stock status(es)"),
+    in_stock: Optional[bool] = Query(None, description="Only products with (true) or without (false) stock"),
+    min_price: Optional[float] = Query(None, ge=0, description="Minimum price, inclusive"),
+    max_price: Optional[float] = Query(None, ge=0, description="Maximum price, inclusive")
+) -> Dict[str, Any]:
+    """Collect the product filter query parameters"""
+    return {
+        "values": {"type": type, "color": color, "graphic": graphic},
+        "stock_statuses": [status.value for status in stock_status] if stock_status else None,
+        "in_stock": in_stock,
+        "min_price": min_price,
+        "max_price": max_price
+    }
+
+def filters_key(filters: Optional[Dict[str, Any]]) -> Tuple:
+    """Normalize product filters into a hashable cache key"""
+    if not filters:
+        return ()
+    return (
+        tuple(
+            (field, tuple(sorted({normalize_value(value) for value in values})))
+            for field, values in sorted(filters["values"].items()) if values
+        ),
+        tuple(sorted(set(filters["stock_statuses"] or ()))),
+        filters["in_stock"],
+        filters["min_price"],
+        filters["max_price"]
+    )
+
+def read_product_page(
+    table: ProductTable,
+    sort_by: Optional[str],
+    reverse: bool,
+    limit: Optional[int],
+    cursor: Optional[str],
+    filters: Optional[Dict[str, Any]] = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+    """Read one page of products, returning them with the pagination headers"""
+    bitmap = table.filter_bitmap(**filters) if filters else None
+    try:
+        after = decode_cursor(cursor, sort_by, reverse) if cursor else None
+        products, last_key = table.page(
+            sort_by, reverse=reverse, limit=limit, after=after, bitmap=bitmap
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {str(e)}")
+
+    total = len(table.products) if bitmap is None else bitmap.bit_count()
+    headers = {"X-Total-Count": str(total)}
+    if last_key is not None:
+        headers["X-Next-Cursor"] = encode_cursor(sort_by, reverse, last_key)
+    return products, headers
+
+def prefetch_next_page(
+    table: ProductTable,
+    sort_by: Optional[str],
+    reverse: bool,
+    limit: Optional[int],
+    headers: Dict[str, str],
+    filters: Optional[Dict[str, Any]],
+    image: DisplayImage
+):
+    """Queue the product thumbnails of the page after the one being served"""
+    cursor = headers.get("X-Next-Cursor")
+    if cursor is not None:
+        products, _ = read_product_page(table, sort_by, reverse, limit, cursor, filters)
+        prefetch_product_images(products, image, "grid")
+
+async def get_product_page(
+    request: Request,
+    sort_by: Optional[str],
+    order: SortOrder,
+    limit: Optional[int],
+    cursor: Optional[str],
+    filters: Optional[Dict[str, Any]] = None
+) -> Response:
+    """Read one page of products as encoded JSON with the pagination headers"""
+    table = get_catalog().products
+    reverse = order == SortOrder.DESC
+
+    def compute() -> Tuple[bytes, Dict[str, str]]:
+        # Nothing is prefetched: listed products link their original images
+        # (image_src), which are served from disk without rendering
+        products, headers = read_product_page(table, sort_by, reverse, limit, cursor, filters)
+        return table.encoded.array(products), headers
+
+    key = ("products", sort_by, reverse, limit, cursor, filters_key(filters))
+    return await cached_json_response(request, key, table.data_version, compute)
 
 @app.get("/products", response_model=List[Product])
 async def get_products(
+    request: Request,
     sort_by: Optional[str] = None,
-    order: SortOrder = SortOrder.ASC
+    order: SortOrder = SortOrder.ASC,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    filters: Dict[str, Any] = Depends(product_filters)
 ):
     """
-    Get all products with optional sorting.
+    Get all products with optional filtering, sorting and pagination.
     
     Parameters:
     - sort_by: Field to sort by (e.g., "stock", "price", "created_at")
     - order: Sort order ("asc" or "desc")
+    - limit: Maximum number of products to return (default: all)
+    - cursor: Value of the X-Next-Cursor header from the previous page
+    - type, color, graphic: Only products with one of the given values (repeatable, case-insensitive)
+    - stock_status: Only products with one of the given stock statuses (repeatable)
+    - in_stock: Only products with (true) or without (false) stock
+    - min_price, max_price: Only products in the price range (inclusive)
     
     Returns:
-    - List of products sorted according to parameters
+    - List of products matching the filters, sorted according to parameters.
+      X-Total-Count holds the number of matching products and, when more
+      products follow, X-Next-Cursor holds the cursor for the next page.
     """
-    products = load_products()
-    
-    if sort_by:
-        if sort_by not in ["stock", "price", "created_at"]:
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid sort field. Must be one of: stock, price, created_at"
-            )
-        
-        # Sort products
-        reverse = order == SortOrder.DESC
-        products.sort(key=lambda x: x[sort_by], reverse=reverse)
+    if sort_by and sort_by not in SORTABLE_FIELDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid sort field. Must be one of: {', '.join(SORTABLE_FIELDS)}"
+        )
     
-    return products
+    # Read products from the presorted index for the field
+    return await get_product_page(request, sort_by or None, order, limit, cursor, filters)
 
 @app.get("/products/sort/stockouts", response_model=List[Product])
-async def get_products_stockouts():
+async def get_products_stockouts(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
     """
     Get all products sorted by stock level (lowest to highest).
     Products with 0 stock will appear first.
     
+    Parameters:
+    - limit: Maximum number of products to return (default: all)
+    - cursor: Value of the X-Next-Cursor header from the previous page
+    
     Returns:
     - List of products sorted by stock level
     """
-    products = load_products()
-    products.sort(key=lambda x: x["stock"])
-    return products
+    return await get_product_page(request, "stock", SortOrder.ASC, limit, cursor)
+
+@app.get("/products/count", response_model=Dict[str, int])
+async def get_products_count(request: Request, filters: Dict[str, Any] = Depends(product_filters)):
+    """
+    Count the products matching the given filters.
+    
+    Parameters:
+    - Same filters as /products
+    
+    Returns:
+    - Number of matching products
+    """
+    table = get_catalog().products
+
+    def compute() -> Tuple[bytes, Dict[str, str]]:
+        bitmap = table.filter_bitmap(**filters)
+        return encode_json({"count": len(table.products) if bitmap is None else bitmap.bit_count()}), {}
+
+    etag = make_etag(table.data_version, "count", repr(filters_key(filters)))
+    return await conditional_json_response(request, etag, CATALOG_CACHE_CONTROL, compute)
+
+@app.get("/products/facets", response_model=ProductFacets)
+async def get_products_facets(
+    request: Request,
+    price_bucket_width: float = Query(25.0, gt=0, description="Width of the price buckets, a multiple of 5"),
+    filters: Dict[str, Any] = Depends(product_filters)
+):
+    """
+    Get live product counts per type, color, stock status and price bucket.
+    
+    Counts for each facet apply every filter except the facet's own, so a
+    filtered facet still shows how many products its other values would match.
+    
+    Parameters:
+    - price_bucket_width: Width of the price buckets (default 25)
+    - Same filters as /products
+    
+    Returns:
+    - Total number of matching products and counts per facet value
+    """
+    table = get_catalog().products
+
+    def compute() -> Tuple[bytes, Dict[str, str]]:
+        try:
+            return encode_json(table.facets(price_bucket_width, **filters)), {}
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    key = ("facets", price_bucket_width, filters_key(filters))
+    return await cached_json_response(request, key, table.data_version, compute)
+
+@app.get("/products/search", response_model=List[Product])
+async def search_products(
+    request: Request,
+    q: str = Query(..., min_length=1, description="Search text"),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    filters: Dict[str, Any] = Depends(product_filters)
+):
+    """
+    Search products by description and graphic, best matches first.
+    
+    Parameters:
+    - q: Search text (e.g. "space planets")
+    - limit: Maximum number of products to return (default 20)
+    - offset: Number of results to skip
+    - Same filters as /products
+    
+    Returns:
+    - List of matching products ranked by relevance. X-Total-Count holds
+      the number of matching products.
+    """
+    table = get_catalog().products
+
+    def compute() -> Tuple[bytes, Dict[str, str]]:
+        bitmap = table.filter_bitmap(**filters)
+        products, total = table.search(q, limit=limit, offset=offset, bitmap=bitmap)
+        return table.encoded.array(products), {"X-Total-Count": str(total)}
+
+    key = ("search", " ".join(q.lower().split()), limit, offset, filters_key(filters))
+    return await cached_json_response(request, key, table.data_version, compute)
+
+@app.get("/products/suggest", response_model=List[Suggestion])
+async def suggest_products(
+    request: Request,
+    q: str = Query(..., min_length=1, description="Text typed so far"),
+    limit: int = Query(10, ge=1, le=50)
+):
+    """
+    Suggest product types, colors and graphics as the user types.
+    
+    Parameters:
+    - q: Text typed so far; matches the start of any word of a value
+    - limit: Maximum number of suggestions (default 10)
+    
+    Returns:
+    - List of suggestions, most purchased first
+    """
+    snapshot = get_catalog()
+    etag = make_etag(snapshot.version, "suggest", " ".join(q.lower().split()), str(limit))
+    return await conditional_json_response(
+        request, etag, CATALOG_CACHE_CONTROL,
+        lambda: (encode_json(snapshot.suggestions.suggest(q, limit=limit)), {})
+    )
+
+@app.get("/products/display", response_model=List[ProductDisplay])
+async def get_products_display(
+    request: Request,
+    ids: Optional[List[str]] = Query(None, description="Product ids (repeatable or comma-separated)"),
+    image: DisplayImage = Query(DisplayImage.INLINE, description="Embed the images (inline) or link them (url)"),
+    sort_by: Optional[str] = None,
+    order: SortOrder = SortOrder.ASC,
+    limit: int = Query(MAX_DISPLAY_BATCH, ge=1, le=MAX_DISPLAY_BATCH),
+    cursor: Optional[str] = None,
+    filters: Dict[str, Any] = Depends(product_filters)
+):
+    """
+    Get display data for many products in one request.
+    
+    Parameters:
+    - ids: Products to return, in this order (unknown ids are skipped). When
+      omitted, a page of products is returned instead, selected like /products
+    - image: "inline" for base64 encoded images, "url" for /image endpoint URLs;
+      either way the 300 pixel grid thumbnails (see /products/{id}/display
+      for the detail image)
+    - sort_by, order, limit, cursor, filters: Page selection as in /products
+      (limit defaults to and may not exceed 100)
+    
+    Returns:
+    - List of formatted products. For pages, X-Total-Count and X-Next-Cursor
+      are set as in /products
+    """
+    table = get_catalog().products
+    if ids:
+        product_ids = list(dict.fromkeys(
+            product_id.strip() for value in ids for product_id in value.split(",") if product_id.strip()
+        ))
+        if len(product_ids) > MAX_DISPLAY_BATCH:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {MAX_DISPLAY_BATCH} ids can be requested at once"
+            )
+        products, headers = table.get_many(product_ids), {}
+    else:
+        if sort_by and sort_by not in SORTABLE_FIELDS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid sort field. Must be one of: {', '.join(SORTABLE_FIELDS)}"
+            )
+        products, headers = read_product_page(
+            table, sort_by or None, order == SortOrder.DESC, limit, cursor, filters
+        )
+        prefetch_next_page(table, sort_by or None, order == SortOrder.DESC, limit, headers, filters, image)
+
+    etag = make_etag(
+        "products-display", image.value, "grid",
+        *(product_display_version(table, product, image) for product in products)
+    )
+    if is_not_modified(request, etag):
+        return not_modified(etag, CATALOG_CACHE_CONTROL, {"Vary": "Accept-Encoding"})
+
+    # Images are processed concurrently on the display image pool
+    if image == DisplayImage.URL:
+        entries = [product_display_entry(product, image, thumbnail=True, listed=True) for product in products]
+    else:
+        entries = await single_flight.run(
+            etag, lambda: run_image_batch("display", lambda product: product_display_entry(product, image, thumbnail=True, listed=True), products)
+        )
+    return await conditional_json_response(
+        request, etag, CATALOG_CACHE_CONTROL, lambda: (encode_json(entries), headers)
+    )
 
 @app.get("/products/{product_id}", response_model=Product)
-async def get_product_by_id(product_id: str):
+async def get_product_by_id(request: Request, product_id: str):
     """
     Get a specific product by ID.
     
@@ -162,37 +904,146 @@ async def get_product_by_id(product_id: str):
     Returns:
     - Product details
     """
-    products = load_products()
-    for product in products:
-        if product["id"] == product_id:
-            return product
-    raise HTTPException(status_code=404, detail="Product not found")
+    table = get_catalog().products
+    product = table.get(product_id)
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    etag = make_etag("product", table.encoded.digest(product))
+    return await conditional_json_response(
+        request, etag, CATALOG_CACHE_CONTROL, lambda: (table.encoded.record(product), {})
+    )
 
 @app.get("/products/{product_id}/display", response_model=ProductDisplay)
-async def get_product_display(product_id: str):
+async def get_product_display(
+    request: Request,
+    product_id: str,
+    image: DisplayImage = Query(DisplayImage.INLINE, description="Embed the image (inline) or link it (url)")
+):
     """
     Get a specific product by ID with formatted display data including the image.
     
     Parameters:
     - product_id: The unique identifier of the product
+    - image: "inline" for a base64 encoded image, "url" for the URL of the
+      product's /image endpoint (no image is processed)
     
     Returns:
-    - Formatted product details with base64 encoded image
+    - Formatted product details with base64 encoded image or image URL
     """
-    products = load_products()
-    for product in products:
-        if product["id"] == product_id:
-            formatted_product = format_product_display(product)
-            if "error" in formatted_product:
-                raise HTTPException(
-                    status_code=500,
-                    detail=formatted_product["error"]
-                )
-            return formatted_product
-    raise HTTPException(status_code=404, detail="Product not found")
+    table = get_catalog().products
+    product = table.get(product_id)
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    etag = make_etag("product-display", image.value, product_display_version(table, product, image))
+
+    def compute() -> Tuple[bytes, Dict[str, str]]:
+        return encode_json(product_display_entry(product, image)), {}
+
+    if image == DisplayImage.URL:
+        return await conditional_json_response(request, etag, CATALOG_CACHE_CONTROL, compute)
+    return await pooled_json_response(request, etag, CATALOG_CACHE_CONTROL, compute)
+
+@app.get(
+    "/products/{product_id}/image",
+    response_class=Response,
+    responses={200: {"content": {media_type: {} for media_type in FORMAT_MEDIA_TYPES.values()}}}
+)
+async def get_product_image(
+    request: Request,
+    product_id: str,
+    w: Optional[int] = Query(None, ge=1, le=4096, description="Wanted width in pixels"),
+    v: Optional[str] = Query(None, description="Content digest of the image, for immutable caching")
+):
+    """
+    Get a product image, resized and re-encoded for the web.
+    
+    Parameters:
+    - product_id: The unique identifier of the product
+    - w: Wanted width in pixels; snapped to the available sizes (300 or 800)
+    - v: Content digest of the image, as in the links of the display endpoints;
+      when current, the response may be cached for good
+    
+    Returns:
+    - The binary image: AVIF or WebP when the Accept header lists it, JPEG otherwise
+    """
+    product = get_catalog().products.get(product_id)
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return await image_response(
+        request, Path(f"../{product['image_path']}"), "products", w, CATALOG_CACHE_CONTROL, v
+    )
+
+async def change_stock(product_id: str, change: Callable[[], Any]) -> Dict[str, Any]:
+    """
+    Apply a stock change and build its StockUpdate response.
+
+    Raises:
+        HTTPException: 404 for an unknown product, 409 when the stock would
+            become negative, 503 when the change cannot be logged
+    """
+    try:
+        product, seq = await change()
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Product not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=f"Insufficient stock: {str(e)}")
+    except InventoryUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": OVERLOAD_RETRY_AFTER})
+    return {
+        "id": product["id"],
+        "stock": product["stock"],
+        "stock_status": stock_status(product["stock"]),
+        "seq": seq
+    }
+
+@app.post("/products/{product_id}/stock/adjust", response_model=StockUpdate)
+async def adjust_stock(product_id: str, adjustment: StockAdjustment):
+    """
+    Add to or remove from the stock of a product, e.g. after a delivery or a stock count.
+
+    Parameters:
+    - product_id: The unique identifier of the product
+    - delta: Number of units to add (negative to remove)
+
+    Returns:
+    - The product's new stock level and the sequence number of the change
+    """
+    return await change_stock(product_id, lambda: inventory.adjust(product_id, adjustment.delta))
+
+@app.post("/products/{product_id}/stock/reserve", response_model=StockUpdate)
+async def reserve_stock(product_id: str, reservation: StockQuantity):
+    """
+    Take units of a product out of stock, e.g. for a checkout.
+
+    Parameters:
+    - product_id: The unique identifier of the product
+    - quantity: Number of units to reserve; fails with 409 if fewer are in stock
+
+    Returns:
+    - The product's new stock level and the sequence number of the change
+    """
+    return await change_stock(product_id, lambda: inventory.reserve(product_id, reservation.quantity))
+
+@app.post("/products/{product_id}/stock/release", response_model=StockUpdate)
+async def release_stock(product_id: str, release: StockQuantity):
+    """
+    Put units of a product back in stock, e.g. for an abandoned checkout.
+
+    Reservations are not tracked per order, so this is the same as
+    adjusting the stock by quantity.
+
+    Parameters:
+    - product_id: The unique identifier of the product
+    - quantity: Number of units to release
+
+    Returns:
+    - The product's new stock level and the sequence number of the change
+    """
+    return await change_stock(product_id, lambda: inventory.release(product_id, release.quantity))
 
 @app.get("/metadata/products", response_model=Metadata)
-async def get_metadata():
+async def get_metadata(request: Request, response: Response):
     """
     Get metadata about the products including:
     - Total number of products
@@ -206,10 +1057,14 @@ async def get_metadata():
     """
     try:
         # Initialize metadata
-        metadata = load_products(data_field="metadata")
-        print(metadata)
-        
-        return metadata
+        table = get_catalog().products
+        # Stock changes are applied in memory, so the stock statistics of the
+        # file are out of date until the next compaction
+        etag = make_etag("products-metadata", table.data_version)
+        if is_not_modified(request, etag):
+            return not_modified(etag, CATALOG_CACHE_CONTROL)
+        response.headers.update(validator_headers(etag, CATALOG_CACHE_CONTROL))
+        return {**table.metadata, "stock_stats": table.stock_stats()}
         
     except Exception as e:
         raise HTTPException(
@@ -217,18 +1072,97 @@ async def get_metadata():
             detail=f"Error generating metadata: {str(e)}"
         )
 
+@app.get("/metadata/cache", response_model=Dict[str, Any])
+async def get_cache_metadata():
+    """
+    Get statistics of the listing result, compressed response and image rendition
+    caches, of the image processing pools and of the image manifest.
+    
+    Returns:
+    - Entry count, size, hits, misses, evictions, hit rate, the cached
+      data version and the number of version invalidations
+    """
+    return {
+        "results": result_cache.stats(),
+        "compressed": compressed_cache.stats(),
+        "renditions": rendition_cache.stats(),
+        "image_pools": {route_class: pool.stats() for route_class, pool in image_pools.items()},
+        "prefetch": prefetcher.stats(),
+        "single_flight": single_flight.stats(),
+        "images": catalog.images.stats()
+    }
+
+@app.post("/catalog/reload", response_model=Dict[str, str])
+async def reload_catalog():
+    """
+    Reload the product and user databases from disk.
+
+    The catalog also reloads on its own when a database file changes; this
+    forces an immediate reload, e.g. right after regenerating the databases.
+
+    Returns:
+    - Versions of the reloaded catalog
+    """
+    try:
+        snapshot = catalog.reload()
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error reloading catalog: {str(e)}"
+        )
+    return {
+        "version": snapshot.version,
+        "products_version": snapshot.products.version,
+        "users_version": snapshot.users.version,
+        "images_version": catalog.images.version
+    }
+
+@app.get("/metadata/inventory", response_model=Dict[str, Any])
+async def get_inventory_metadata():
+    """
+    Get statistics of the inventory log.
+
+    Returns:
+    - Log position and size, write and compaction counters
+    """
+    return inventory.stats()
+
+@app.post("/inventory/compact", response_model=Dict[str, Any])
+async def compact_inventory():
+    """
+    Compact the inventory log into the product database now.
+
+    Compaction also runs on its own every INVENTORY_COMPACT_INTERVAL
+    seconds; this forces one, e.g. before copying the database.
+
+    Returns:
+    - Whether a compaction ran and the inventory log statistics
+    """
+    try:
+        compacted = await inventory.compact()
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error compacting inventory: {str(e)}"
+        )
+    return {"compacted": compacted, **inventory.stats()}
+
 @app.get("/users", response_model=List[User])
-async def get_users():
+async def get_users(request: Request):
     """
     Get all users.
     
     Returns:
     - List of all users
     """
-    return load_users()
+    table = get_catalog().users
+    etag = make_etag("users", table.data_version)
+    return await conditional_json_response(
+        request, etag, USER_CACHE_CONTROL, lambda: (table.encoded.array(table.users), {})
+    )
 
 @app.get("/users/{user_id}", response_model=User)
-async def get_user_by_id(user_id: str):
+async def get_user_by_id(request: Request, user_id: str):
     """
     Get a specific user by ID.
     
@@ -238,14 +1172,16 @@ async def get_user_by_id(user_id: str):
     Returns:
     - User details
     """
-    users = load_users()
-    for user in users:
-        if user_id in (user["id"], user["id"].replace("user_", "")):
-            return user
-    raise HTTPException(status_code=404, detail="User not found")
+    snapshot = get_catalog()
+    user = get_user_or_404(snapshot, user_id)
+    encoded = snapshot.users.encoded
+    etag = make_etag("user", encoded.digest(user))
+    return await conditional_json_response(
+        request, etag, USER_CACHE_CONTROL, lambda: (encoded.record(user), {})
+    )
 
 @app.get("/users/{user_id}/purchases", response_model=List[Product])
-async def get_user_purchases(user_id: str):
+async def get_user_purchases(request: Request, user_id: str):
     """
     Get all products purchased by a specific user.
     
@@ -255,29 +1191,19 @@ async def get_user_purchases(user_id: str):
     Returns:
     - List of purchased products
     """
-    users = load_users()
-    user = None
-    for u in users:
-        if u["id"] == user_id or u["id"].replace("user_", "") == user_id:
-            user = u
-            break
-    
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Get product details for each purchase
-    products = load_products()
-    purchased_products = []
-    for product_id in user["purchase_history"]:
-        for product in products:
-            if product["id"] == product_id:
-                purchased_products.append(product)
-                break
-    
-    return purchased_products
+    snapshot = get_catalog()
+    user = get_user_or_404(snapshot, user_id)
+
+    # Get product details for each purchase in one batched lookup
+    products = snapshot.products
+    etag = make_etag("purchases", snapshot.users.encoded.digest(user), products.data_version)
+    return await conditional_json_response(
+        request, etag, USER_CACHE_CONTROL,
+        lambda: (products.encoded.array(snapshot.user_purchases(user)), {})
+    )
 
 @app.get("/users/{user_id}/cart", response_model=Dict[str, Any])
-async def get_user_cart(user_id: str):
+async def get_user_cart(request: Request, user_id: str):
     """
     Get the current cart status for a specific user.
     
@@ -287,14 +1213,15 @@ async def get_user_cart(user_id: str):
     Returns:
     - User's cart status
     """
-    users = load_users()
-    for user in users:
-        if user["id"] == user_id or user["id"].replace("user_", "") == user_id:
-            return user["cart_status"]
-    raise HTTPException(status_code=404, detail="User not found")
+    snapshot = get_catalog()
+    user = get_user_or_404(snapshot, user_id)
+    etag = make_etag("cart", snapshot.users.encoded.digest(user))
+    return await conditional_json_response(
+        request, etag, USER_CACHE_CONTROL, lambda: (encode_json(user["cart_status"]), {})
+    )
 
 @app.get("/users/{user_id}/style-preferences", response_model=List[str])
-async def get_user_style_preferences(user_id: str):
+async def get_user_style_preferences(request: Request, user_id: str):
     """
     Get the style preferences for a specific user.
     
@@ -304,14 +1231,15 @@ async def get_user_style_preferences(user_id: str):
     Returns:
     - List of user's style preferences
     """
-    users = load_users()
-    for user in users:
-        if user["id"] == user_id or user["id"].replace("user_", "") == user_id:
-            return user["style_preferences"]
-    raise HTTPException(status_code=404, detail="User not found")
+    snapshot = get_catalog()
+    user = get_user_or_404(snapshot, user_id)
+    etag = make_etag("style-preferences", snapshot.users.encoded.digest(user))
+    return await conditional_json_response(
+        request, etag, USER_CACHE_CONTROL, lambda: (encode_json(user["style_preferences"]), {})
+    )
 
 @app.get("/metadata/users", response_model=UserMetadata)
-async def get_users_metadata():
+async def get_users_metadata(request: Request, response: Response):
     """
     Get metadata about the users including:
     - Total number of users
@@ -322,8 +1250,12 @@ async def get_users_metadata():
     - Users metadata statistics
     """
     try:
-        data = load_users(data_field="metadata");
-        return data
+        table = get_catalog().users
+        etag = make_etag("users-metadata", table.version)
+        if is_not_modified(request, etag):
+            return not_modified(etag, USER_CACHE_CONTROL)
+        response.headers.update(validator_headers(etag, USER_CACHE_CONTROL))
+        return table.metadata
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -331,22 +1263,163 @@ async def get_users_metadata():
         )
 
 @app.get("/users/{user_id}/display")
-async def get_user_display(user_id: str):
+async def get_user_display(
+    request: Request,
+    user_id: str,
+    image: DisplayImage = Query(DisplayImage.INLINE, description="Embed the image (inline) or link it (url)")
+):
     """
     Get a specific user by ID with formatted display data including the image.
     Parameters:
     - user_id: The unique identifier of the user
+    - image: "inline" for a base64 encoded image, "url" for the URL of the
+      user's /image endpoint (no image is processed)
     Returns:
-    - Formatted user details with base64 encoded image
+    - Formatted user details with base64 encoded image or image URL
     """
-    users = load_users()
-    for user in users:
-        if user["id"] == user_id or user["id"].replace("user_", "") == user_id:
-            formatted_user = format_user_display(user)
-            if "error" in formatted_user:
-                raise HTTPException(
-                    status_code=500,
-                    detail=formatted_user["error"]
-                )
-            return formatted_user
-    raise HTTPException(status_code=404, detail="User not found")
\ No newline at end of file
+    snapshot = get_catalog()
+    user = get_user_or_404(snapshot, user_id)
+    # The user's products are the likeliest to be viewed next
+    prefetch_user_products(snapshot, user, image)
+    etag = make_etag("user-display", image.value, user_display_version(snapshot, user, image))
+
+    def compute() -> Tuple[bytes, Dict[str, str]]:
+        return encode_json(user_display_entry(user, image)), {}
+
+    if image == DisplayImage.URL:
+        return await conditional_json_response(request, etag, USER_CACHE_CONTROL, compute)
+    return await pooled_json_response(request, etag, USER_CACHE_CONTROL, compute)
+
+@app.get("/users/{user_id}/page", response_model=UserPage)
+async def get_user_page(
+    request: Request,
+    user_id: str,
+    image: DisplayImage = Query(DisplayImage.INLINE, description="Embed the images (inline) or link them (url)")
+):
+    """
+    Get everything the user page shows in one request.
+    Parameters:
+    - user_id: The unique identifier of the user
+    - image: "inline" for base64 encoded images, "url" for /image endpoint URLs
+    Returns:
+    - The user's display data, the purchased products and the cart items,
+      each product with its current data and a thumbnail image
+    """
+    snapshot = get_catalog()
+    user = get_user_or_404(snapshot, user_id)
+    purchases = snapshot.user_purchases(user)
+    cart_items = snapshot.user_cart_items(user)
+
+    # Each product is formatted once, even if it was bought and is in the cart
+    products = {product["id"]: product for product in purchases}
+    for item in cart_items:
+        if item["product"] is not None:
+            products.setdefault(item["product"]["id"], item["product"])
+    # The page shows thumbnails; full product views are likely to follow
+    prefetch_product_images(list(products.values()), image)
+
+    etag = make_etag(
+        "user-page", image.value, user_display_version(snapshot, user, image),
+        *(product_display_version(snapshot.products, product, image) for product in products.values())
+    )
+    if is_not_modified(request, etag):
+        return not_modified(etag, USER_CACHE_CONTROL, {"Vary": "Accept-Encoding"})
+
+    tasks = [functools.partial(user_display_entry, user, image)] + [
+        functools.partial(product_display_entry, product, image, True, True) for product in products.values()
+    ]
+    # Image work for the user and all products runs concurrently on the display image pool
+    if image == DisplayImage.URL:
+        entries = [task() for task in tasks]
+    else:
+        entries = await single_flight.run(etag, lambda: run_image_batch("display", lambda task: task(), tasks))
+    user_entry, product_entries = entries[0], dict(zip(products, entries[1:]))
+
+    cart_status = user.get("cart_status", {})
+    page = {
+        "user": user_entry,
+        "purchases": [product_entries[product["id"]] for product in purchases],
+        "cart": {
+            "items": [
+                {
+                    **{key: value for key, value in item.items() if key != "product"},
+                    "product": product_entries[item["product"]["id"]] if item["product"] is not None else None
+                }
+                for item in cart_items
+            ],
+            "total_items": cart_status.get("total_items", 0),
+            "total_price": cart_status.get("total_price", 0.0)
+        }
+    }
+    return await conditional_json_response(
+        request, etag, USER_CACHE_CONTROL, lambda: (encode_json(page), {})
+    )
+
+@app.get(
+    "/users/{user_id}/image",
+    response_class=Response,
+    responses={200: {"content": {media_type: {} for media_type in FORMAT_MEDIA_TYPES.values()}}}
+)
+async def get_user_image(
+    request: Request,
+    user_id: str,
+    w: Optional[int] = Query(None, ge=1, le=4096, description="Wanted width in pixels"),
+    v: Optional[str] = Query(None, description="Content digest of the image, for immutable caching")
+):
+    """
+    Get a user's profile picture, resized and re-encoded for the web.
+    Parameters:
+    - user_id: The unique identifier of the user
+    - w: Wanted width in pixels; snapped to the available size (400)
+    - v: Content digest of the image, as in the links of the display endpoints;
+      when current, the response may be cached for good
+    Returns:
+    - The binary image: AVIF or WebP when the Accept header lists it, JPEG otherwise
+    """
+    user = get_user_or_404(get_catalog(), user_id)
+    return await image_response(
+        request, Path(f"../{user['image_url']}"), "users", w, USER_CACHE_CONTROL, v
+    )
+
+@app.get(
+    ASSETS_PREFIX + "/{digest}/{image_path:path}",
+    response_class=FileResponse,
+    responses={200: {"content": {"image/jpeg": {}}}}
+)
+async def get_image_asset(request: Request, digest: str, image_path: str):
+    """
+    Get an original image by its content-hashed URL.
+
+    The URLs are the image_src fields of products and users. The content
+    behind a URL never changes, so it is served with an immutable
+    Cache-Control header and supports range requests. A URL whose digest
+    is outdated redirects to the image's current URL.
+    
+    Parameters:
+    - digest: Content digest of the image
+    - image_path: Path of the image in the images directory, e.g. products/scarf_floral_3.jpg
+    
+    Returns:
+    - The original image file
+    """
+    # Also refreshes the image manifest when due
+    get_catalog()
+    images = catalog.images
+    source = Path(images.images_dir) / image_path
+    current = images.digest(str(source))
+    if current is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if digest != current:
+        return RedirectResponse(images.url(str(source)), status_code=302, headers={"Cache-Control": "no-cache"})
+
+    etag = f'"{digest}"'
+    if is_not_modified(request, etag):
+        return not_modified(etag, IMMUTABLE_CACHE_CONTROL)
+    try:
+        stat = source.stat()
+    except OSError:
+        raise HTTPException(status_code=404, detail="Image not found")
+    # Never let an image replaced since the last manifest refresh be cached
+    # for good under the digest of its previous content
+    cache_control = IMMUTABLE_CACHE_CONTROL if images.is_current(str(source), stat) else "no-cache"
+    return FileResponse(source, stat_result=stat, headers=validator_headers(etag, cache_control))
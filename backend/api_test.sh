@@ -6,28 +6,50 @@ PRODUCT_ID="1"
 # List of endpoints to test
 endpoints=(
   "/products"
+  "/products?limit=5&type=scarf&sort_by=price&order=desc"
+  "/products/count?type=scarf"
+  "/products/facets?in_stock=true"
+  "/products/search?q=floral+scarf&limit=5"
+  "/products/suggest?q=sc"
   "/products/$PRODUCT_ID"
   "/products/$PRODUCT_ID/display"
+  "/products/display?ids=$PRODUCT_ID&image=url"
+  "/products/display?image=url&limit=5"
   "/products/sort/stockouts"
   "/metadata/products"
+  "/metadata/inventory"
+  "/metadata/cache"
   "/users"
   "/users/$USER_ID"
   "/users/$USER_ID/display"
+  "/users/$USER_ID/page?image=url"
   "/users/$USER_ID/purchases"
   "/users/$USER_ID/cart"
   "/metadata/users"
 )
 
+# POST endpoints and their JSON bodies; a zero adjustment is logged but
+# leaves the stock as it is
+post_endpoints=(
+  "/products/$PRODUCT_ID/stock/adjust|{\"delta\": 0}"
+)
+
 total=0
 passed=0
 failed=0
 
 function test_endpoint() {
   local endpoint=$1
+  local data=$2
   local url="$API_URL$endpoint"
   echo "Testing $endpoint ..."
   echo "  URL: $url"
-  response=$(curl -s -w "HTTPSTATUS:%{http_code}" "$url")
+  if [ -n "$data" ]; then
+    echo "  Body: $data"
+    response=$(curl -s -w "HTTPSTATUS:%{http_code}" -X POST -H "Content-Type: application/json" -d "$data" "$url")
+  else
+    response=$(curl -s -w "HTTPSTATUS:%{http_code}" "$url")
+  fi
   body=$(echo "$response" | sed -e 's/HTTPSTATUS:.*//g')
   status=$(echo "$response" | tr -d '\n' | sed -e 's/.*HTTPSTATUS://')
   
@@ -64,6 +86,9 @@ echo
 for endpoint in "${endpoints[@]}"; do
   test_endpoint "$endpoint"
 done
+for entry in "${post_endpoints[@]}"; do
+  test_endpoint "${entry%%|*}" "${entry#*|}"
+done
 echo "--- Test Summary ---"
 echo "Total: $total | Passed: $passed | Failed: $failed"
 
@@ -0,0 +1,98 @@
+"""
+Benchmark the image rendition profiles.
+
+Renders every profile of PROFILES_BY_KIND in every format the installed
+Pillow can encode, for a sample of the product and user images, and prints
+the encoded size and the rendering time per image. Each rendition is timed
+twice: decoding the full-size source, and decoding it at a reduced scale
+(JPEG draft mode) as the API and build_renditions.py do.
+
+Usage (from the backend directory):
+    python benchmark_renditions.py [--images ../images] [--limit 20]
+"""
+from typing import Dict, List
+from pathlib import Path
+from PIL import Image
+import argparse
+import statistics
+import time
+
+from renditions import IMAGE_EXTENSIONS, IMAGES_DIR, PROFILES_BY_KIND, profile_formats, profile_params, render_image, render_rendition
+
+
+def sample_images(images_dir: str, kind: str, limit: int) -> List[Path]:
+    """Pick up to limit images of a kind, spread evenly over the directory"""
+    paths = sorted(
+        path for path in (Path(images_dir) / kind).rglob("*")
+        if path.suffix.lower() in IMAGE_EXTENSIONS and path.is_file()
+    )
+    step = max(1, len(paths) // limit) if limit else 1
+    return paths[::step][:limit] if limit else paths
+
+
+def render_full(path: Path, profile: str, format: str) -> bytes:
+    """Render a rendition from the fully decoded source, for comparison"""
+    with Image.open(path) as img:
+        img.load()
+        return render_image(img, profile, format)
+
+
+def benchmark(paths: List[Path], profile: str, format: str) -> Dict[str, float]:
+    """
+    Render one profile and format of each image, with and without draft decoding.
+
+    Returns:
+        Dictionary with the mean and largest size in bytes and the mean
+        milliseconds per image of both decoding paths
+    """
+    sizes: List[int] = []
+    full_ms: List[float] = []
+    draft_ms: List[float] = []
+    for path in paths:
+        started = time.perf_counter()
+        render_full(path, profile, format)
+        full_ms.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        sizes.append(len(render_rendition(path, profile, format)))
+        draft_ms.append((time.perf_counter() - started) * 1000)
+    return {
+        "mean_bytes": statistics.mean(sizes),
+        "max_bytes": max(sizes),
+        "full_ms": statistics.mean(full_ms),
+        "draft_ms": statistics.mean(draft_ms)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the image rendition profiles")
+    parser.add_argument("--images", default=IMAGES_DIR, help="Images directory (default: %(default)s)")
+    parser.add_argument(
+        "--limit", type=int, default=20, help="Images per directory, 0 for all (default: %(default)s)"
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'profile':<8} {'format':<6} {'size':>5} {'quality':>7} {'target':>7} "
+        f"{'mean B':>8} {'max B':>8} {'full ms':>8} {'draft ms':>8}"
+    )
+    for kind, profiles in PROFILES_BY_KIND.items():
+        paths = sample_images(args.images, kind, args.limit)
+        if not paths:
+            continue
+        source_bytes = statistics.mean(path.stat().st_size for path in paths)
+        print(f"{kind}: {len(paths)} images, {source_bytes:.0f} bytes per original")
+        for profile in profiles:
+            for format in profile_formats(profile):
+                max_size, _, quality, max_bytes = profile_params(profile, format)
+                result = benchmark(paths, profile, format)
+                target = f"{max_bytes // 1024}K" if max_bytes is not None else "-"
+                print(
+                    f"{profile:<8} {format:<6} {max_size:>5} {quality:>7} {target:>7} "
+                    f"{result['mean_bytes']:>8.0f} {result['max_bytes']:>8} "
+                    f"{result['full_ms']:>8.1f} {result['draft_ms']:>8.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Prebuild every image rendition the API serves.
+
+Walks the product and user image directories, renders each profile of
+PROFILES_BY_KIND in every format the installed Pillow can encode, using a
+process pool across all cores, and writes the files plus a manifest that
+the API reads at startup. Images whose content hash and profile
+parameters match the existing manifest are skipped, so rebuilding after
+adding a few images only renders those.
+
+Also refreshes the image manifest (content hashes and placeholders) that
+the catalog embeds in product and user records, so the API starts without
+hashing or decoding any image.
+
+Usage (from the backend directory):
+    python build_renditions.py [--images ../images] [--output ../.cache/prebuilt] [--workers N]
+                               [--image-manifest ../db/image_manifest.json]
+"""
+from typing import Dict, Any, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from PIL import Image
+import argparse
+import json
+import time
+
+from files import write_atomic
+from image_manifest import IMAGE_MANIFEST_PATH, ImageManifest
+from renditions import (
+    IMAGE_EXTENSIONS, IMAGES_DIR, MANIFEST_NAME, MANIFEST_VERSION, PREBUILT_DIR, PROFILES_BY_KIND, RENDITION_PROFILES,
+    draft, file_sha256, profile_formats, profile_params, render_image, rendition_name
+)
+
+def build_image(
+    source: str,
+    sha256: str,
+    profiles: Tuple[str, ...],
+    output: str
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Render the given profiles of one image (runs in a worker process).
+
+    The image is decoded once for all of its profiles and formats, at the
+    reduced scale the largest profile allows.
+
+    Returns:
+        Dictionary of profile -> format -> manifest entry of the rendition
+    """
+    renditions: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    with Image.open(source) as img:
+        draft(img, max(RENDITION_PROFILES[profile]["max_size"] for profile in profiles))
+        img.load()
+        for profile in profiles:
+            for format in profile_formats(profile):
+                name = rendition_name(sha256, profile, format)
+                path = Path(output) / name
+                if not path.exists():
+                    write_atomic(path, render_image(img, profile, format))
+                renditions.setdefault(profile, {})[format] = {
+                    "file": name, "params": list(profile_params(profile, format))
+                }
+    return renditions
+
+
+def load_manifest(output: Path) -> Dict[str, Dict[str, Any]]:
+    """Load the images of an existing manifest (empty if there is none)"""
+    try:
+        with open(output / MANIFEST_NAME) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest.get("images", {})
+
+
+def is_current(entry: Optional[Dict[str, Any]], sha256: str, profiles: Tuple[str, ...], output: Path) -> bool:
+    """Check whether a manifest entry already holds every rendition of an image"""
+    if entry is None or entry["sha256"] != sha256:
+        return False
+    for profile in profiles:
+        for format in profile_formats(profile):
+            rendition = entry["renditions"].get(profile, {}).get(format)
+            if rendition is None or rendition["params"] != list(profile_params(profile, format)):
+                return False
+            if not (output / rendition["file"]).exists():
+                return False
+    return True
+
+
+def build(images_dir: str, output_dir: str, workers: Optional[int] = None) -> Dict[str, int]:
+    """
+    Build the renditions of every image and write the manifest.
+
+    Args:
+        images_dir: Directory containing the products/ and users/ image directories
+        output_dir: Directory for the renditions and the manifest
+        workers: Number of worker processes (default: one per core)
+
+    Returns:
+        Dictionary with the number of images built, skipped and failed
+    """
+    images_root = Path(images_dir)
+    output = Path(output_dir)
+    previous = load_manifest(output)
+
+    images: Dict[str, Dict[str, Any]] = {}
+    jobs: List[Tuple[str, str, Dict[str, Any], Tuple[str, ...]]] = []
+    for kind, profiles in PROFILES_BY_KIND.items():
+        kind_dir = images_root / kind
+        if not kind_dir.is_dir():
+            continue
+        for path in sorted(kind_dir.rglob("*")):
+            if path.suffix.lower() not in IMAGE_EXTENSIONS or not path.is_file():
+                continue
+            relative = path.relative_to(images_root).as_posix()
+            stat = path.stat()
+            sha256 = file_sha256(path)
+            entry = {"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            if is_current(previous.get(relative), sha256, profiles, output):
+                images[relative] = {**entry, "renditions": previous[relative]["renditions"]}
+            else:
+                jobs.append((relative, str(path), entry, profiles))
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            (relative, entry, pool.submit(build_image, source, entry["sha256"], profiles, str(output)))
+            for relative, source, entry, profiles in jobs
+        ]
+        for relative, entry, future in futures:
+            try:
+                images[relative] = {**entry, "renditions": future.result()}
+            except Exception as e:
+                failed += 1
+                print(f"Failed to build renditions of {relative}: {e}")
+
+    output.mkdir(parents=True, exist_ok=True)
+    manifest = {"version": MANIFEST_VERSION, "images": dict(sorted(images.items()))}
+    write_atomic(output / MANIFEST_NAME, json.dumps(manifest, indent=1).encode())
+    return {"built": len(jobs) - failed, "skipped": len(images) - len(jobs) + failed, "failed": failed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prebuild the image renditions served by the API")
+    parser.add_argument("--images", default=IMAGES_DIR, help="Images directory (default: %(default)s)")
+    parser.add_argument("--output", default=PREBUILT_DIR, help="Output directory (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument(
+        "--image-manifest", default=IMAGE_MANIFEST_PATH, help="Image manifest file (default: %(default)s)"
+    )
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    result = build(args.images, args.output, args.workers)
+    print(
+        f"Built {result['built']} images, skipped {result['skipped']} unchanged, "
+        f"{result['failed']} failed in {time.perf_counter() - started:.1f}s"
+    )
+
+    started = time.perf_counter()
+    images = ImageManifest(args.images, args.image_manifest)
+    images.refresh()
+    print(f"Image manifest of {len(images.images)} images refreshed in {time.perf_counter() - started:.1f}s")
+    if result["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
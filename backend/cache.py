@@ -0,0 +1,135 @@
+from typing import Dict, Any, Callable, Hashable, Optional
+from collections import OrderedDict
+import threading
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with hit/miss statistics.
+
+    Args:
+        max_entries: Maximum number of entries kept
+        max_bytes: Maximum total size of the entries (None for no limit)
+        sizeof: Function returning the size of a value in bytes
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = len
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        # Neither counted as a lookup nor marking the entry recently used
+        return key in self._entries
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Get a cached value (None on a miss), marking it recently used"""
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        """Cache a value, evicting least recently used entries to fit"""
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._sizes.pop(key)
+                del self._entries[key]
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                evicted, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry (statistics are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the cache statistics"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class VersionedCache(LRUCache):
+    """
+    LRU cache whose entries are only valid for one data version.
+
+    Every lookup passes the current data version; when it differs from the
+    version the cached entries were computed for, the whole cache is
+    dropped, so a reload or a stock change can never serve stale results.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version: Optional[str] = None
+        self.invalidations = 0
+
+    def _check_version(self, version: str):
+        if version != self.version:
+            with self._lock:
+                if version == self.version:
+                    return
+                if self.version is not None:
+                    self.invalidations += 1
+                self.version = version
+                self._entries.clear()
+                self._sizes.clear()
+                self._bytes = 0
+
+    def get_versioned(self, key: Hashable, version: str) -> Optional[Any]:
+        """Get a value cached for the given data version"""
+        self._check_version(version)
+        return self.get(key)
+
+    def set_versioned(self, key: Hashable, value: Any, version: str):
+        """Cache a value computed from the given data version"""
+        # A result computed from data that changed meanwhile is not cached
+        if version == self.version:
+            self.set(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the cache statistics, including the cached data version"""
+        stats = super().stats()
+        stats["version"] = self.version
+        stats["invalidations"] = self.invalidations
+        return stats
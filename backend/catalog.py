@@ -0,0 +1,868 @@
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+from itertools import count, islice
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from indexes import (
+    SortedIndex, BitmapIndex, RangeBitmapIndex,
+    bitmap_to_bytes, intersect_bitmaps, iter_bitmap, top_positions
+)
+from image_manifest import ImageManifest
+from inventory import InventoryLog
+from renditions import IMAGES_DIR
+from search import SearchIndex, SuggestionIndex
+from serialization import EncodedRecords
+
+PRODUCTS_DB_PATH = os.environ.get("PRODUCTS_DB_PATH", "../db/product_database.json")
+USERS_DB_PATH = os.environ.get("USERS_DB_PATH", "../db/users_database.json")
+
+# How often (in seconds) the database files are stat'ed for changes
+RELOAD_CHECK_INTERVAL = float(os.environ.get("CATALOG_RELOAD_CHECK_INTERVAL", "1.0"))
+
+# Fields of the Product and User response models, in response order
+PRODUCT_FIELDS = (
+    "id", "image_path", "image_src", "image_placeholder", "description", "type", "color", "graphic",
+    "variant", "stock", "price", "created_at"
+)
+USER_FIELDS = (
+    "id", "name", "description", "style_preferences", "image_url", "image_src",
+    "image_placeholder", "purchase_history", "cart_status", "created_at"
+)
+
+# Fields added to the records at load time, never written back to the databases
+DERIVED_FIELDS = ("image_src", "image_placeholder")
+
+# Product fields that listings can be sorted by
+SORTABLE_FIELDS = ("stock", "price", "created_at")
+
+# Product attributes that listings can be filtered on by exact value
+FILTERABLE_FIELDS = ("type", "color", "graphic")
+
+# Stock levels below this are reported as low stock
+LOW_STOCK_THRESHOLD = 10
+STOCK_STATUSES = ("in_stock", "low_stock", "out_of_stock")
+
+# Width of the bins used by the price range index
+PRICE_BIN_WIDTH = 5.0
+
+
+
+def stock_status(stock: int) -> str:
+    """Classify a stock level as in_stock, low_stock or out_of_stock"""
+    if stock == 0:
+        return "out_of_stock"
+    return "low_stock" if stock < LOW_STOCK_THRESHOLD else "in_stock"
+
+
+def normalize_value(value: str) -> str:
+    """Normalize an attribute value for case-insensitive matching"""
+    return " ".join(value.lower().split())
+
+
+# Distinguishes table instances loaded by this process
+_table_loads = count(1)
+
+
+def attach_images(
+    records: List[Dict[str, Any]], path_field: str, images: ImageManifest
+) -> Dict[str, List[int]]:
+    """
+    Set the image_src and image_placeholder of records from the image manifest.
+
+    Args:
+        records: Records of a table, in table order
+        path_field: Field holding the image path relative to the repository root
+        images: Image manifest
+
+    Returns:
+        Positions of the records per image, keyed by path relative to the images directory
+    """
+    positions: Dict[str, List[int]] = {}
+    for position, record in enumerate(records):
+        image_path = f"../{record[path_field]}"
+        record["image_src"] = images.url(image_path)
+        record["image_placeholder"] = images.placeholder(image_path)
+        positions.setdefault(images.relative(image_path), []).append(position)
+    return positions
+
+
+def refresh_images(
+    records: List[Dict[str, Any]],
+    path_field: str,
+    image_positions: Dict[str, List[int]],
+    images: ImageManifest,
+    changed: Iterable[str],
+    encoded: EncodedRecords
+) -> int:
+    """
+    Update the image_src and image_placeholder of the records using changed images.
+
+    Returns:
+        Number of records updated
+    """
+    updated = 0
+    for relative in changed:
+        for position in image_positions.get(relative, ()):
+            record = records[position]
+            image_path = f"../{record[path_field]}"
+            src, placeholder = images.url(image_path), images.placeholder(image_path)
+            if (record["image_src"], record["image_placeholder"]) != (src, placeholder):
+                record["image_src"], record["image_placeholder"] = src, placeholder
+                encoded.invalidate(position)
+                updated += 1
+    return updated
+
+
+def file_signature(path: str) -> Tuple[int, int]:
+    """
+    Get the change signature of a database file.
+
+    Args:
+        path: Path to the database file
+
+    Returns:
+        Tuple of (modification time in nanoseconds, size in bytes)
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def signature_version(signature: Tuple[int, int], images_version: str = "") -> str:
+    """
+    Derive a short version string from a file signature.
+
+    The version only depends on the file itself and the content of the
+    images it references, so every worker process serving the same files
+    reports the same version.
+    """
+    source = f"{signature[0]}:{signature[1]}"
+    if images_version:
+        source += f":{images_version}"
+    return hashlib.sha1(source.encode()).hexdigest()[:12]
+
+
+def encode_cursor(sort_by: Optional[str], reverse: bool, key: Tuple[Any, str]) -> str:
+    """
+    Encode an opaque pagination cursor.
+
+    Args:
+        sort_by: Field the listing is sorted by (None for catalog order)
+        reverse: Whether the listing is in descending order
+        key: (sort value, product id) of the last product on the page
+
+    Returns:
+        URL-safe cursor string
+    """
+    payload = json.dumps([sort_by, reverse, key[0], key[1]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_by: Optional[str], reverse: bool) -> Tuple[Any, str]:
+    """
+    Decode a pagination cursor created by encode_cursor.
+
+    Args:
+        cursor: Cursor string from a previous page
+        sort_by: Field the requested listing is sorted by
+        reverse: Whether the requested listing is in descending order
+
+    Returns:
+        (sort value, product id) of the last product on the previous page
+
+    Raises:
+        ValueError: If the cursor is malformed or belongs to another ordering
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort_by, cursor_reverse, value, product_id = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise ValueError("Malformed cursor")
+    if cursor_sort_by != sort_by or cursor_reverse != reverse:
+        raise ValueError("Cursor does not match the requested sort order")
+    # Both are used as index keys, so anything else would fail deep in a lookup
+    if not isinstance(product_id, str) or not isinstance(value, (str, int, float, type(None))):
+        raise ValueError("Malformed cursor")
+    return value, product_id
+
+
+class ProductTable:
+    """
+    Products loaded from the product database.
+
+    Args:
+        data: Parsed contents of the product database file
+        version: Version string of the file the data was loaded from
+        images: Manifest the products' content-hashed image URLs and
+            placeholders are taken from
+    """
+
+    def __init__(self, data: Dict[str, Any], version: str, images: Optional[ImageManifest] = None):
+        self.products: List[Dict[str, Any]] = data["products"]
+        self.metadata: Dict[str, Any] = data.get("metadata", {})
+        self.version = version
+        # Product positions per image, to update the records when an image changes
+        self.image_positions: Dict[str, List[int]] = (
+            attach_images(self.products, "image_path", images) if images is not None else {}
+        )
+        # Number of in-memory changes (e.g. stock updates) since loading
+        self.revision = 0
+        self._load_id = next(_table_loads)
+
+        # Primary key index: product id -> position in self.products.
+        # The first product wins on duplicate ids, like the old linear scan.
+        self.positions: Dict[str, int] = {}
+        for position, product in enumerate(self.products):
+            self.positions.setdefault(product["id"], position)
+
+        # Kept current by set_stock, for the live stock statistics
+        self.stock_total = sum(product["stock"] for product in self.products)
+
+        # Secondary indexes that keep the catalog presorted per sortable field
+        self.sorted_indexes: Dict[str, SortedIndex] = {
+            field: SortedIndex(self.products, field) for field in SORTABLE_FIELDS
+        }
+
+        # Bitmap indexes for filtering, with bit n standing for self.products[n]
+        self.all_bitmap = (1 << len(self.products)) - 1
+        self.bitmap_indexes: Dict[str, BitmapIndex] = {
+            field: BitmapIndex(self.products, lambda product, field=field: normalize_value(product[field]))
+            for field in FILTERABLE_FIELDS
+        }
+        self.bitmap_indexes["stock_status"] = BitmapIndex(
+            self.products, lambda product: stock_status(product["stock"])
+        )
+        self.price_index = RangeBitmapIndex(self.products, "price", PRICE_BIN_WIDTH)
+
+        # Full-text index over description and graphic
+        self.search_index = SearchIndex(self.products)
+
+        # JSON encoding of each product, reused across responses
+        self.encoded = EncodedRecords(
+            self.products, PRODUCT_FIELDS, lambda product: self.positions.get(product["id"])
+        )
+
+    @property
+    def data_version(self) -> str:
+        """
+        Version of the product data, changing on reload and on every in-memory change.
+
+        Unchanged data reports the file version, which every worker process
+        agrees on. Once changed in memory, the version also names this
+        table instance, so it never repeats across reloads.
+        """
+        if self.revision == 0:
+            return self.version
+        return f"{self.version}.{self._load_id}.{self.revision}"
+
+    def get(self, product_id: str) -> Optional[Dict[str, Any]]:
+        """Get a product by id, or None if it does not exist"""
+        position = self.positions.get(product_id)
+        return None if position is None else self.products[position]
+
+    def get_many(self, product_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Get several products by id in one pass.
+
+        Args:
+            product_ids: Product ids, in the order the products should be returned
+
+        Returns:
+            The matching products in the given order; unknown ids are skipped
+        """
+        positions = self.positions
+        products = self.products
+        return [
+            products[positions[product_id]]
+            for product_id in product_ids
+            if product_id in positions
+        ]
+
+
+    def sorted_products(
+        self,
+        field: str,
+        reverse: bool = False,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Get products ordered by a sortable field.
+
+        Args:
+            field: One of SORTABLE_FIELDS
+            reverse: Sort in descending order
+            limit: Only return the first ``limit`` products
+
+        Returns:
+            List of products in sorted order
+        """
+        products = self.products
+        positions = self.sorted_indexes[field].positions(reverse=reverse, limit=limit)
+        return [products[position] for position in positions]
+
+    def filter_bitmaps(
+        self,
+        values: Optional[Dict[str, List[str]]] = None,
+        stock_statuses: Optional[List[str]] = None,
+        in_stock: Optional[bool] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None
+    ) -> Dict[str, int]:
+        """
+        Evaluate each product filter against the bitmap indexes.
+
+        Args:
+            values: Accepted values per field in FILTERABLE_FIELDS (case-insensitive)
+            stock_statuses: Accepted values from STOCK_STATUSES
+            in_stock: Only products with (True) or without (False) stock
+            min_price: Minimum price, inclusive
+            max_price: Maximum price, inclusive
+
+        Returns:
+            Bitmap of the products passing each given filter, keyed by filter
+            name (a field name, "stock_status", "in_stock" or "price")
+        """
+        bitmaps = {}
+        for field, field_values in (values or {}).items():
+            if field_values:
+                bitmaps[field] = self.bitmap_indexes[field].union(
+                    [normalize_value(value) for value in field_values]
+                )
+        if stock_statuses:
+            bitmaps["stock_status"] = self.bitmap_indexes["stock_status"].union(stock_statuses)
+        if in_stock is not None:
+            out_of_stock = self.bitmap_indexes["stock_status"].get("out_of_stock")
+            bitmaps["in_stock"] = self.all_bitmap & ~out_of_stock if in_stock else out_of_stock
+        if min_price is not None or max_price is not None:
+            bitmaps["price"] = self.price_index.range(min_price, max_price)
+        return bitmaps
+
+    def filter_bitmap(self, **filters) -> Optional[int]:
+        """
+        Evaluate product filters against the bitmap indexes.
+
+        Values of the same field are ORed together and different filters
+        are ANDed. Takes the same arguments as filter_bitmaps.
+
+        Returns:
+            Bitmap of matching products, or None when no filter was given
+        """
+        return intersect_bitmaps(self.filter_bitmaps(**filters).values())
+
+    def facets(self, price_bucket_width: float, **filters) -> Dict[str, Any]:
+        """
+        Count matching products per facet value.
+
+        Counts for each facet apply every filter except the facet's own, so
+        the other values of a filtered facet keep their counts (e.g. with
+        type=scarf the type facet still shows how many sweaters match the
+        remaining filters). Counts come from ANDing the maintained bitmaps,
+        never from scanning products.
+
+        Args:
+            price_bucket_width: Width of the price buckets, a multiple of PRICE_BIN_WIDTH
+            **filters: Same arguments as filter_bitmaps
+
+        Returns:
+            Dictionary with the total match count, counts per type, color and
+            stock status, and a list of price buckets
+
+        Raises:
+            ValueError: If price_bucket_width is not a multiple of PRICE_BIN_WIDTH
+        """
+        bitmaps = self.filter_bitmaps(**filters)
+
+        def without(*names: str) -> Optional[int]:
+            return intersect_bitmaps(
+                bitmap for name, bitmap in bitmaps.items() if name not in names
+            )
+
+        total = intersect_bitmaps(bitmaps.values())
+        stock_base = without("stock_status")
+        stock_base = self.all_bitmap if stock_base is None else stock_base
+        return {
+            "total": len(self.products) if total is None else total.bit_count(),
+            "types": self.bitmap_indexes["type"].counts(without("type")),
+            "colors": self.bitmap_indexes["color"].counts(without("color")),
+            "stock_status": {
+                status: (self.bitmap_indexes["stock_status"].get(status) & stock_base).bit_count()
+                for status in STOCK_STATUSES
+            },
+            "price_buckets": [
+                {"min": low, "max": high, "count": count}
+                for low, high, count in self.price_index.bucket_counts(price_bucket_width, without("price"))
+            ]
+        }
+
+    def page(
+        self,
+        sort_by: Optional[str] = None,
+        reverse: bool = False,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[Any, str]] = None,
+        bitmap: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[Tuple[Any, str]]]:
+        """
+        Get one page of products using keyset pagination.
+
+        Pages are addressed by the (sort value, product id) of the last
+        product already returned, so a deep page costs the same as the first
+        one and products whose stock changes between pages are neither
+        repeated nor skipped unless they move across the page boundary.
+
+        Args:
+            sort_by: One of SORTABLE_FIELDS, or None for catalog order
+            reverse: Sort in descending order
+            limit: Maximum number of products to return (None for all)
+            after: (sort value, product id) of the last product of the previous page
+            bitmap: Only return products in this bitmap (see filter_bitmap)
+
+        Returns:
+            Tuple of (products, key of the last product if more products follow)
+
+        Raises:
+            ValueError: If ``after`` refers to an unknown product in catalog order
+        """
+        fetch = None if limit is None else limit + 1
+        if sort_by is None:
+            start = 0
+            if after is not None:
+                if after[1] not in self.positions:
+                    raise ValueError("Cursor refers to an unknown product")
+                start = self.positions[after[1]] + 1
+            if bitmap is None:
+                end = len(self.products) if fetch is None else min(start + fetch, len(self.products))
+                positions = range(start, end)
+            else:
+                # Drop everything up to the cursor, then read set bits in order
+                positions = islice(iter_bitmap(bitmap >> start << start), fetch)
+        else:
+            index_after = None
+            if after is not None:
+                index_after = (after[0], self.positions.get(after[1]))
+            try:
+                positions = self._sorted_positions(sort_by, reverse, fetch, index_after, bitmap)
+            except TypeError:
+                raise ValueError("Cursor value does not match the sort field")
+        products = [self.products[position] for position in positions]
+
+        if limit is None or len(products) <= limit:
+            return products, None
+        products = products[:limit]
+        last = products[-1]
+        return products, (None if sort_by is None else last[sort_by], last["id"])
+
+    def search(
+        self,
+        query: str,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        bitmap: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Full-text search over product descriptions and graphics.
+
+        Args:
+            query: Free-text query
+            limit: Maximum number of products to return (None for all)
+            offset: Number of ranked products to skip
+            bitmap: Only return products in this bitmap (see filter_bitmap)
+
+        Returns:
+            Tuple of (products ranked by relevance, number of matching products)
+        """
+        ranked, total = self.search_index.search(
+            query, bitmap=bitmap, limit=None if limit is None else offset + limit
+        )
+        return [self.products[position] for position, _ in ranked[offset:]], total
+
+    def _sorted_positions(
+        self,
+        sort_by: str,
+        reverse: bool,
+        fetch: Optional[int],
+        after: Optional[Tuple[Any, Optional[int]]],
+        bitmap: Optional[int]
+    ) -> List[int]:
+        index = self.sorted_indexes[sort_by]
+        if bitmap is None:
+            return index.positions(reverse=reverse, limit=fetch, after=after)
+
+        # Walk the presorted index, keeping matching products. Filters
+        # correlated with the sort field (e.g. a price range when sorting by
+        # price) can make the walk long, so after visiting as many products
+        # as there are matches, order just the matches with a bounded heap.
+        matches = bitmap.bit_count()
+        bits = bitmap_to_bytes(bitmap)
+        size = len(bits)
+        found = []
+        for visited, position in enumerate(index.iter_positions(reverse=reverse, after=after)):
+            if visited >= matches:
+                break
+            byte = position >> 3
+            if byte < size and bits[byte] >> (position & 7) & 1:
+                found.append(position)
+                if len(found) == fetch:
+                    return found
+        else:
+            return found
+
+        return top_positions(
+            self.products, sort_by, iter_bitmap(bitmap),
+            reverse=reverse, limit=fetch, after=after
+        )
+
+    def set_stock(self, product_id: str, stock: int) -> Dict[str, Any]:
+        """
+        Change the stock of a product, keeping the stock index in order.
+
+        Args:
+            product_id: The unique identifier of the product
+            stock: New stock level
+
+        Returns:
+            The updated product
+
+        Raises:
+            KeyError: If the product does not exist
+        """
+        position = self.positions[product_id]
+        product = self.products[position]
+        self.sorted_indexes["stock"].update(position, product["stock"], stock)
+        self.bitmap_indexes["stock_status"].update(
+            position, stock_status(product["stock"]), stock_status(stock)
+        )
+        self.stock_total += stock - product["stock"]
+        product["stock"] = stock
+        self.encoded.invalidate(position)
+        self.revision += 1
+        return product
+
+    def stock_stats(self) -> Dict[str, float]:
+        """Get the total and average stock of the products as they are now"""
+        count = len(self.products)
+        return {"total": self.stock_total, "average": round(self.stock_total / count, 2) if count else 0.0}
+
+    def refresh_images(self, images: ImageManifest, changed: Iterable[str]) -> int:
+        """
+        Update the image URLs and placeholders of the products using changed images.
+
+        Args:
+            images: Image manifest, already refreshed
+            changed: Relative paths of the changed images
+
+        Returns:
+            Number of products updated
+        """
+        updated = refresh_images(self.products, "image_path", self.image_positions, images, changed, self.encoded)
+        if updated:
+            self.revision += 1
+        return updated
+
+    def to_data(self, inventory_seq: int) -> Dict[str, Any]:
+        """
+        Get the products in the product database format, with their current stock.
+
+        Args:
+            inventory_seq: Sequence number of the last inventory log change included
+
+        Returns:
+            Contents for the product database file
+        """
+        products = [
+            {field: value for field, value in product.items() if field not in DERIVED_FIELDS}
+            for product in self.products
+        ]
+        metadata = dict(self.metadata)
+        metadata["stock_stats"] = self.stock_stats()
+        metadata["inventory_seq"] = inventory_seq
+        return {"products": products, "metadata": metadata}
+
+
+class UserTable:
+    """
+    Users loaded from the users database.
+
+    Args:
+        data: Parsed contents of the users database file
+        version: Version string of the file the data was loaded from
+        images: Manifest the users' content-hashed image URLs and
+            placeholders are taken from
+    """
+
+    def __init__(self, data: Dict[str, Any], version: str, images: Optional[ImageManifest] = None):
+        self.users: List[Dict[str, Any]] = data["users"]
+        self.metadata: Dict[str, Any] = data.get("metadata", {})
+        self.version = version
+        # User positions per image, to update the records when an image changes
+        self.image_positions: Dict[str, List[int]] = (
+            attach_images(self.users, "image_url", images) if images is not None else {}
+        )
+        # Number of in-memory changes (image updates) since loading
+        self.revision = 0
+        self._load_id = next(_table_loads)
+
+        # User index keyed by both the full id and its short alias
+        # ("user_1" and "1"). The first user in file order wins, like the
+        # old linear scan.
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        for user in self.users:
+            self.by_id.setdefault(user["id"], user)
+            self.by_id.setdefault(user["id"].replace("user_", ""), user)
+
+        # JSON encoding of each user, reused across responses
+        self.positions: Dict[str, int] = {}
+        for position, user in enumerate(self.users):
+            self.positions.setdefault(user["id"], position)
+        self.encoded = EncodedRecords(
+            self.users, USER_FIELDS, lambda user: self.positions.get(user["id"])
+        )
+
+    @property
+    def data_version(self) -> str:
+        """Version of the user data, changing on reload and on every in-memory change"""
+        if self.revision == 0:
+            return self.version
+        return f"{self.version}.{self._load_id}.{self.revision}"
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get a user by id ("user_1") or short id ("1"), or None"""
+        return self.by_id.get(user_id)
+
+    def refresh_images(self, images: ImageManifest, changed: Iterable[str]) -> int:
+        """
+        Update the image URLs and placeholders of the users using changed images.
+
+        Args:
+            images: Image manifest, already refreshed
+            changed: Relative paths of the changed images
+
+        Returns:
+            Number of users updated
+        """
+        updated = refresh_images(self.users, "image_url", self.image_positions, images, changed, self.encoded)
+        if updated:
+            self.revision += 1
+        return updated
+
+
+class CatalogSnapshot:
+    """
+    Consistent view of the product and user tables.
+
+    A snapshot is never modified by a reload; the store swaps in a new
+    snapshot instead, so a request that holds one keeps seeing the same data.
+    """
+
+    def __init__(self, products: ProductTable, users: UserTable):
+        self.products = products
+        self.users = users
+        self.version = f"{products.version}-{users.version}"
+
+        # Vocabulary suggestions are weighted by purchases, so they depend on
+        # both tables; the vocabulary is small enough to rebuild per snapshot
+        self.suggestions = SuggestionIndex(products.products, users.users)
+
+    def user_purchases(self, user: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Join a user's purchase history with the product table.
+
+        Args:
+            user: User dictionary from the users table
+
+        Returns:
+            Purchased products in purchase history order; unknown ids are skipped
+        """
+        return self.products.get_many(user["purchase_history"])
+
+    def user_cart_items(self, user: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Join a user's cart items with the product table.
+
+        Args:
+            user: User dictionary from the users table
+
+        Returns:
+            The cart items, each with its current product under "product"
+            (None if the product no longer exists)
+        """
+        products = self.products
+        return [
+            {**item, "product": products.get(item["product_id"])}
+            for item in user.get("cart_status", {}).get("items", [])
+        ]
+
+
+class CatalogStore:
+    """
+    Process-resident store for the product and user databases.
+
+    Both databases are parsed once and kept in memory. The files are checked
+    for changes (modification time and size) at most once per
+    ``check_interval`` seconds, and only a database that changed is parsed
+    again. A failed reload keeps serving the previous snapshot.
+
+    Records carry the content-hashed URLs and placeholders of their images.
+    Once start() is called, the image manifest is refreshed on the same
+    schedule by a background thread, since hashing the images and rendering
+    placeholders takes time proportional to the catalog; only the records
+    referencing a changed image are then updated, on the next snapshot().
+    reload() refreshes the manifest itself.
+
+    Stock changes made since the product database was last written are
+    kept in the inventory log and replayed onto every product table loaded.
+
+    Args:
+        products_path: Path to the product database JSON file
+        users_path: Path to the users database JSON file
+        check_interval: Minimum number of seconds between file change checks
+        images_dir: Directory of the images the records reference
+        inventory_log: Inventory log replayed onto the products (default: a
+            log at INVENTORY_LOG_PATH)
+    """
+
+    def __init__(
+        self,
+        products_path: str = PRODUCTS_DB_PATH,
+        users_path: str = USERS_DB_PATH,
+        check_interval: float = RELOAD_CHECK_INTERVAL,
+        images_dir: str = IMAGES_DIR,
+        inventory_log: Optional[InventoryLog] = None
+    ):
+        self.products_path = products_path
+        self.users_path = users_path
+        self.check_interval = check_interval
+        self.images = ImageManifest(images_dir)
+        self.inventory = inventory_log if inventory_log is not None else InventoryLog()
+        # Images changed by a background refresh, not applied to the records yet
+        self._changed_images: Set[str] = set()
+        self._watcher: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._signatures: Dict[str, Tuple[int, int]] = {}
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> CatalogSnapshot:
+        """
+        Get the current catalog snapshot, reloading changed files if due.
+
+        Returns:
+            The current CatalogSnapshot
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.reload()
+
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            try:
+                if self._changed_paths():
+                    snapshot = self._reload_changed(force=False)
+            except Exception as e:
+                # Keep serving the last good snapshot, e.g. while a file is
+                # being rewritten; the next check will try again
+                print(f"Catalog reload failed, serving previous version: {str(e)}")
+            if self._changed_images:
+                self._apply_image_changes(snapshot)
+        return snapshot
+
+    def reload(self) -> CatalogSnapshot:
+        """
+        Reload both database files and swap in a new snapshot.
+
+        Returns:
+            The newly loaded CatalogSnapshot
+        """
+        self.images.refresh()
+        with self._lock:
+            # The new tables are built from the refreshed manifest
+            self._changed_images.clear()
+        return self._reload_changed(force=True)
+
+    def start(self):
+        """Start refreshing the image manifest in a background thread"""
+        if self._watcher is None:
+            self._stopping.clear()
+            self._watcher = threading.Thread(target=self._watch_images, name="image-manifest", daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        """Stop the background image manifest refresh"""
+        if self._watcher is not None:
+            self._stopping.set()
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch_images(self):
+        while not self._stopping.wait(self.check_interval):
+            try:
+                changed = self.images.refresh()
+            except Exception as e:
+                print(f"Image manifest refresh failed: {str(e)}")
+                continue
+            if changed:
+                with self._lock:
+                    self._changed_images |= changed
+
+    def _apply_image_changes(self, snapshot: CatalogSnapshot):
+        with self._lock:
+            changed, self._changed_images = self._changed_images, set()
+        snapshot.products.refresh_images(self.images, changed)
+        snapshot.users.refresh_images(self.images, changed)
+
+    def _changed_paths(self) -> List[str]:
+        return [
+            path for path in (self.products_path, self.users_path)
+            if self._signatures.get(path) != file_signature(path)
+        ]
+
+    def _load_table(self, path: str, table_class):
+        # Stat before reading so a write racing with the read is picked up
+        # by the next change check
+        signature = file_signature(path)
+        with open(path, "r") as f:
+            data = json.load(f)
+        version = signature_version(signature, self.images.version)
+        table = table_class(data, version, self.images)
+        if table_class is ProductTable:
+            self.inventory.replay(table)
+        return table, signature
+
+    def mark_current(self, path: str):
+        """Record a database file rewritten by this process with the data already loaded, so it is not reloaded"""
+        with self._lock:
+            self._signatures[path] = file_signature(path)
+
+    def _reload_changed(self, force: bool) -> CatalogSnapshot:
+        with self._lock:
+            current = self._snapshot
+            if current is None:
+                force = True
+            changed = (
+                [self.products_path, self.users_path] if force
+                else self._changed_paths()
+            )
+            if not changed:
+                return current
+
+            signatures = {}
+            products = current.products if current else None
+            users = current.users if current else None
+            if self.products_path in changed:
+                products, signatures[self.products_path] = self._load_table(
+                    self.products_path, ProductTable
+                )
+            if self.users_path in changed:
+                users, signatures[self.users_path] = self._load_table(
+                    self.users_path, UserTable
+                )
+
+            snapshot = CatalogSnapshot(products, users)
+            self._signatures.update(signatures)
+            self._snapshot = snapshot
+            self._last_check = time.monotonic()
+            return snapshot
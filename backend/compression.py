@@ -0,0 +1,86 @@
+from typing import Dict, Optional, Tuple
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Bodies smaller than this are sent as they are: the saving would not pay
+# for the Content-Encoding header and the client's decompression
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))
+
+# Compressed variants are computed once per representation and cached, so
+# high (slow) levels are affordable
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+# Bodies at least this large (mostly responses with inline images) are
+# compressed on a worker thread instead of the event loop, and at a fast
+# level: a high level gains only a few percent on them, for several times
+# the CPU time
+COMPRESS_FAST_SIZE = int(os.environ.get("COMPRESS_FAST_SIZE", str(256 * 1024)))
+GZIP_FAST_LEVEL = 1
+BROTLI_FAST_QUALITY = 4
+
+
+def supported_encodings() -> Tuple[str, ...]:
+    """Get the content codings this server can produce, most preferred first"""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the content coding for a response from an Accept-Encoding header.
+
+    Args:
+        accept_encoding: Accept-Encoding header value (None if absent)
+
+    Returns:
+        "br" or "gzip", or None to send the body uncompressed. Among codings
+        with the same quality value brotli is preferred.
+    """
+    if not accept_encoding:
+        return None
+
+    qualities: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+
+    best, best_quality = None, 0.0
+    for coding in supported_encodings():
+        quality = qualities.get(coding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """
+    Compress a response body, at a fast level if it is COMPRESS_FAST_SIZE or larger.
+
+    Args:
+        body: Uncompressed body
+        encoding: Content coding, "br" or "gzip"
+
+    Returns:
+        The compressed body
+    """
+    fast = len(body) >= COMPRESS_FAST_SIZE
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_FAST_QUALITY if fast else BROTLI_QUALITY)
+    # mtime=0 keeps the output deterministic for identical bodies
+    return gzip.compress(body, compresslevel=GZIP_FAST_LEVEL if fast else GZIP_LEVEL, mtime=0)
@@ -0,0 +1,262 @@
+from typing import Dict, Any, Awaitable, Callable, Hashable, List, Optional, TypeVar
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
+import os
+import sys
+import threading
+import time
+
+T = TypeVar("T")
+
+
+class Overloaded(Exception):
+    """Raised when a bounded executor has no room for another task"""
+
+
+def lower_thread_priority(nice: int):
+    """
+    Lower the CPU scheduling priority of the calling thread.
+
+    On Linux the niceness is per thread, so worker threads can be made to
+    yield the CPU to the event loop thread. Elsewhere (or if the change is
+    not allowed) this does nothing.
+
+    Args:
+        nice: Niceness added to the thread's current one (0 to leave it as is)
+    """
+    if nice <= 0 or not sys.platform.startswith("linux"):
+        return
+    try:
+        thread_id = threading.get_native_id()
+        current = os.getpriority(os.PRIO_PROCESS, thread_id)
+        os.setpriority(os.PRIO_PROCESS, thread_id, min(19, current + nice))
+    except OSError:
+        pass
+
+
+class BoundedExecutor:
+    """
+    Thread pool for blocking work with a bounded queue, used from async routes.
+
+    Blocking work (image decoding and encoding) runs on the pool, so the
+    event loop keeps serving other requests meanwhile. At most
+    ``max_workers`` tasks run at once and at most ``max_queue`` more wait;
+    beyond that new tasks are rejected immediately instead of piling up
+    latency for everyone. Each item of a batch counts as a task, and a
+    batch is only admitted whole. A task that waited longer than
+    ``max_wait`` for a worker is shed when it would start: its client has
+    likely given up, and running it would only delay the tasks behind it.
+
+    Args:
+        max_workers: Number of worker threads
+        max_queue: Number of tasks allowed to wait for a worker
+        name: Prefix of the worker thread names
+        max_wait: Seconds a task may wait for a worker (None for no limit)
+        nice: Niceness added to the worker threads, so that the event loop
+            (serving the cheap routes) gets the CPU first
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        max_queue: int,
+        name: str,
+        max_wait: Optional[float] = None,
+        nice: int = 0
+    ):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.nice = nice
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=name,
+            initializer=lower_thread_priority,
+            initargs=(nice,)
+        )
+        # Only touched from the event loop thread, so no lock is needed
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.shed = 0
+
+    def _admit(self, tasks: int = 1):
+        # A batch larger than the whole pool can still run while it is idle
+        if self.pending and self.pending + tasks > self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise Overloaded(f"{self.pending} tasks already pending")
+        self.pending += tasks
+
+    def _release(self):
+        self.pending -= 1
+        self.completed += 1
+
+    def _submit(self, loop: asyncio.AbstractEventLoop, func: Callable[..., T], *args: Any) -> "Future[T]":
+        """Submit an admitted task, giving its slot back once it finished or was cancelled before starting"""
+        future = self._executor.submit(func, *args)
+
+        def done(_: "Future[T]"):
+            try:
+                loop.call_soon_threadsafe(self._release)
+            except RuntimeError:
+                # The event loop is closed (shutdown)
+                pass
+        future.add_done_callback(done)
+        return future
+
+    def _guard(self, func: Callable[..., T]) -> Callable[..., T]:
+        """Wrap the function of a task (or batch) so that it is shed if it waited too long to start"""
+        if self.max_wait is None:
+            return func
+        # Items of a batch wait behind each other, so the wait of an item
+        # counts from the start of the previous one
+        started = [time.monotonic()]
+
+        def guarded(*args: Any) -> T:
+            now = time.monotonic()
+            if now - started[0] > self.max_wait:
+                raise Overloaded(f"Waited more than {self.max_wait}s for a worker")
+            started[0] = now
+            return func(*args)
+        return guarded
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """
+        Run a blocking function on the pool and wait for its result.
+
+        Raises:
+            Overloaded: If all workers are busy and the queue is full, or
+                the task waited longer than max_wait
+        """
+        self._admit()
+        future = self._submit(asyncio.get_running_loop(), self._guard(func), *args)
+        try:
+            # Cancelling the wait (e.g. for a disconnected client) also
+            # cancels the task if it has not started yet
+            return await asyncio.wrap_future(future)
+        except Overloaded:
+            self.shed += 1
+            raise
+
+    async def map(self, func: Callable[[Any], T], items: List[Any]) -> List[T]:
+        """
+        Run a blocking function over items on the pool, concurrently.
+
+        Every item counts against the queue, and the batch is admitted
+        whole or rejected, so one large request cannot be half rejected;
+        the pool still runs at most max_workers items at once. If an item
+        fails, the items that have not started are cancelled; each item
+        holds its place in the queue until it finished or was cancelled.
+
+        Raises:
+            Overloaded: If the workers and the queue have no room for all
+                items, or an item waited longer than max_wait
+        """
+        self._admit(len(items))
+        loop = asyncio.get_running_loop()
+        guarded = self._guard(func)
+        futures = [self._submit(loop, guarded, item) for item in items]
+        try:
+            return list(await asyncio.gather(*(asyncio.wrap_future(future) for future in futures)))
+        except BaseException as e:
+            for future in futures:
+                future.cancel()
+            if isinstance(e, Overloaded):
+                self.shed += 1
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the pool size, queue limits and depth and the task counters"""
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "max_wait": self.max_wait,
+            "nice": self.nice,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "shed": self.shed
+        }
+
+    def shutdown(self):
+        """Stop the worker threads after the running tasks finish"""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+class _Flight:
+    """A computation in flight and the number of callers waiting for it"""
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical computations, used from async routes.
+
+    The first caller for a key starts the computation; callers arriving
+    while it is in flight wait for the same result (or exception) instead
+    of repeating the work. Nothing is kept once it finishes: the next call
+    for the key starts a new computation, and caching is left to the
+    caches. The computation runs as its own task, so a caller that goes
+    away (e.g. a disconnected client) does not cancel it for the others.
+
+    Keys should identify the result exactly, like the ETags of the
+    responses computed.
+
+    Args:
+        max_reported_keys: Number of keys with the most waiters listed by stats()
+    """
+
+    def __init__(self, max_reported_keys: int = 10):
+        self.max_reported_keys = max_reported_keys
+        # Only touched from the event loop thread, so no lock is needed
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Get the result of a computation, sharing it with concurrent calls for the same key.
+
+        Args:
+            key: Identity of the result
+            func: Function starting the computation
+
+        Returns:
+            The result of the computation
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(func()))
+            self._flights[key] = flight
+            self.started += 1
+
+            def done(task: "asyncio.Task"):
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                # Mark a failure as retrieved even if every caller went away
+                if not task.cancelled():
+                    task.exception()
+            flight.task.add_done_callback(done)
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the computations in flight, the busiest keys' waiter counts and the counters"""
+        busiest = sorted(self._flights.items(), key=lambda item: item[1].waiters, reverse=True)
+        return {
+            "in_flight": len(self._flights),
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "waiters": {
+                str(key): flight.waiters for key, flight in busiest[:self.max_reported_keys]
+            }
+        }
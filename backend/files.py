@@ -0,0 +1,53 @@
+from pathlib import Path
+from typing import Union
+import os
+import tempfile
+
+
+def file_mode(path: Union[str, Path]) -> int:
+    """Get the permission bits of a file, or those a new file would get"""
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def write_atomic(path: Union[str, Path], data: bytes, durable: bool = False):
+    """
+    Write a file through a temporary file renamed into place, so readers
+    (including other worker processes) never see it partial.
+
+    The file keeps the permissions of the one it replaces (mkstemp would
+    leave it private to the owner).
+
+    Args:
+        path: File to write
+        data: New contents
+        durable: Also fsync the data and the rename, so the new contents
+            survive a crash once this returns
+
+    Raises:
+        OSError: If the file cannot be written
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        os.fchmod(fd, file_mode(path))
+        with os.fdopen(fd, "wb") as temp_file:
+            temp_file.write(data)
+            if durable:
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    if durable:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
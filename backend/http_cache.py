@@ -0,0 +1,74 @@
+from typing import Dict, Optional
+from fastapi import Request, Response
+import hashlib
+import os
+
+# Catalog data is public and changes rarely, but stock moves, so browsers
+# and CDNs may reuse a response briefly and must revalidate after that
+CATALOG_CACHE_CONTROL = os.environ.get(
+    "CATALOG_CACHE_CONTROL", "public, max-age=30, stale-while-revalidate=30"
+)
+
+# User data is personal: only the browser may keep it, and must revalidate
+USER_CACHE_CONTROL = os.environ.get("USER_CACHE_CONTROL", "private, no-cache")
+
+
+def make_etag(*parts: str) -> str:
+    """
+    Build a strong ETag from the values a response is derived from.
+
+    Args:
+        *parts: Data versions, ids and normalized parameters of the response
+
+    Returns:
+        Quoted ETag header value
+    """
+    digest = hashlib.sha1("\x1f".join(parts).encode()).hexdigest()[:24]
+    return f'"{digest}"'
+
+
+def file_version(path: str) -> str:
+    """Get a version string for a file from its modification time and size"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return "missing"
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """
+    Check whether the client already holds the representation with this ETag.
+
+    If-None-Match uses weak comparison, so a W/ prefix on the client's
+    tags is ignored.
+
+    Args:
+        request: Incoming request
+        etag: Current ETag of the requested representation
+
+    Returns:
+        True when a 304 Not Modified response can be sent
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def validator_headers(etag: str, cache_control: str) -> Dict[str, str]:
+    """Get the caching headers sent with both full and 304 responses"""
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+
+def not_modified(etag: str, cache_control: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Build a 304 Not Modified response carrying the validators"""
+    return Response(status_code=304, headers={**(headers or {}), **validator_headers(etag, cache_control)})
@@ -0,0 +1,249 @@
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import os
+import threading
+
+from cache import LRUCache
+from files import write_atomic
+from renditions import RenditionManifest, profile_params
+
+
+class RenditionCache:
+    """
+    Two-tier cache of encoded image renditions.
+
+    Renditions are kept in a bounded in-memory LRU and in a directory on
+    disk, which survives restarts and is shared by all worker processes.
+    Renditions prebuilt by build_renditions.py are served from their
+    manifest before either tier is filled by rendering.
+
+    Entries are keyed by the source image's path, modification time and
+    size plus the rendition parameters, so replacing an image or changing
+    the parameters can never serve a stale rendition. Files of replaced
+    images are simply no longer looked up; the directory can be deleted
+    at any time.
+
+    The disk tier is bounded by ``disk_max_bytes``: when a write takes it
+    over the budget, the least recently used files (by modification time,
+    refreshed on every disk hit) are deleted down to DISK_EVICT_TARGET of
+    it. Eviction looks at the directory itself, so it accounts for the
+    files written by other workers too.
+
+    Renditions loaded ahead of time by the prefetcher are remembered until
+    a request first uses them, to count how many prefetches paid off.
+
+    Args:
+        directory: Directory of the disk tier (None to only cache in memory)
+        max_entries: Maximum number of renditions kept in memory
+        max_bytes: Maximum total size of the renditions kept in memory
+        manifest: Manifest of prebuilt renditions (None if there is none)
+        disk_max_bytes: Maximum total size of the disk tier (None for no limit)
+    """
+
+    # Fraction of disk_max_bytes an eviction shrinks the disk tier to, so
+    # that the directory is not scanned again on every following write
+    DISK_EVICT_TARGET = 0.9
+
+    def __init__(
+        self,
+        directory: Optional[str],
+        max_entries: int,
+        max_bytes: int,
+        manifest: Optional[RenditionManifest] = None,
+        disk_max_bytes: Optional[int] = None
+    ):
+        self.directory = Path(directory) if directory else None
+        self.memory = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        self.manifest = manifest
+        self.disk_max_bytes = disk_max_bytes
+        # Size of the disk tier as of the last scan plus this process's
+        # writes since (None until first needed)
+        self._disk_bytes: Optional[int] = None
+        self._disk_lock = threading.Lock()
+        self.disk_evictions = 0
+        self.prebuilt_hits = 0
+        self.disk_hits = 0
+        self.renders = 0
+        # Keys of prefetched renditions not requested yet, oldest first
+        self._prefetched: "OrderedDict[str, None]" = OrderedDict()
+        self.prefetched = 0
+        self.prefetch_hits = 0
+
+    def key(self, image_path: Path, profile: str, format: str = "JPEG") -> str:
+        """
+        Get the cache key of a rendition.
+
+        Raises:
+            OSError: If the source image cannot be accessed
+        """
+        stat = image_path.stat()
+        params = (profile, *profile_params(profile, format))
+        source = f"{os.path.abspath(image_path)}\x1f{stat.st_mtime_ns}\x1f{stat.st_size}\x1f{params!r}"
+        return hashlib.sha1(source.encode()).hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        path = self._disk_path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        if self.disk_max_bytes is not None:
+            try:
+                # Mark the file recently used for eviction
+                os.utime(path)
+            except OSError:
+                pass
+        return data
+
+    def _write_disk(self, key: str, data: bytes):
+        try:
+            write_atomic(self._disk_path(key), data)
+        except OSError as e:
+            # The disk tier is an optimization; serving goes on without it
+            print(f"Could not write rendition {key}: {e}")
+            return
+        if self.disk_max_bytes is None:
+            return
+        with self._disk_lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+            else:
+                self._disk_bytes += len(data)
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+
+    def _disk_files(self) -> List[Tuple[int, int, str]]:
+        """List the files of the disk tier as (modification time, size, path)"""
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    # Deleted meanwhile, e.g. by another worker's eviction
+                    continue
+                files.append((stat.st_mtime_ns, stat.st_size, path))
+        return files
+
+    def _evict_disk(self):
+        files = self._disk_files()
+        total = sum(size for _, size, _ in files)
+        target = self.disk_max_bytes * self.DISK_EVICT_TARGET
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Could not evict rendition {path}: {e}")
+                continue
+            total -= size
+            self.disk_evictions += 1
+        self._disk_bytes = total
+
+    def get_or_render(
+        self,
+        image_path: Path,
+        profile: str,
+        render: Callable[[], bytes],
+        format: str = "JPEG"
+    ) -> bytes:
+        """
+        Get a rendition from the cache, rendering and storing it on a miss.
+
+        Args:
+            image_path: Path of the source image
+            profile: Name of the rendition profile
+            render: Function producing the encoded rendition
+            format: Output format of the rendition
+
+        Returns:
+            The encoded rendition
+        """
+        key = self.key(image_path, profile, format)
+        data = self.memory.get(key)
+        if data is not None:
+            if self._prefetched.pop(key, False) is None:
+                self.prefetch_hits += 1
+            return data
+        return self._load(key, image_path, profile, render, format)
+
+    def prefetch(
+        self,
+        image_path: Path,
+        profile: str,
+        render: Callable[[], bytes],
+        format: str = "JPEG"
+    ) -> bool:
+        """
+        Load a rendition into the memory tier ahead of a request.
+
+        Args:
+            image_path: Path of the source image
+            profile: Name of the rendition profile
+            render: Function producing the encoded rendition
+            format: Output format of the rendition
+
+        Returns:
+            False if the rendition was already in memory, True if it was loaded
+        """
+        key = self.key(image_path, profile, format)
+        if key in self.memory:
+            return False
+        self._load(key, image_path, profile, render, format)
+        self.prefetched += 1
+        self._prefetched[key] = None
+        while len(self._prefetched) > self.memory.max_entries:
+            self._prefetched.popitem(last=False)
+        return True
+
+    def _load(
+        self,
+        key: str,
+        image_path: Path,
+        profile: str,
+        render: Callable[[], bytes],
+        format: str
+    ) -> bytes:
+        if self.manifest is not None:
+            data = self.manifest.get(image_path, profile, format)
+            if data is not None:
+                self.prebuilt_hits += 1
+                self.memory.set(key, data)
+                return data
+
+        if self.directory is not None:
+            data = self._read_disk(key)
+            if data is not None:
+                self.disk_hits += 1
+                self.memory.set(key, data)
+                return data
+
+        data = render()
+        self.renders += 1
+        self.memory.set(key, data)
+        if self.directory is not None:
+            self._write_disk(key, data)
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the memory tier statistics plus prebuilt and disk hits, renders and prefetches"""
+        stats = self.memory.stats()
+        stats["prebuilt_images"] = len(self.manifest.images) if self.manifest is not None else 0
+        stats["prebuilt_hits"] = self.prebuilt_hits
+        stats["disk_hits"] = self.disk_hits
+        stats["disk_max_bytes"] = self.disk_max_bytes
+        stats["disk_evictions"] = self.disk_evictions
+        stats["renders"] = self.renders
+        stats["prefetched"] = self.prefetched
+        stats["prefetch_hits"] = self.prefetch_hits
+        stats["directory"] = str(self.directory) if self.directory is not None else None
+        return stats
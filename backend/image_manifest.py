@@ -0,0 +1,200 @@
+from typing import Dict, Any, Optional, Set, Tuple
+from pathlib import Path
+import hashlib
+import json
+import os
+import threading
+
+from files import write_atomic
+from renditions import IMAGE_EXTENSIONS, IMAGES_DIR, PLACEHOLDER_FORMAT, file_sha256, profile_params, render_placeholder
+
+# File the manifest is kept in between runs, next to the databases
+IMAGE_MANIFEST_PATH = os.environ.get("IMAGE_MANIFEST_PATH", "../db/image_manifest.json")
+IMAGE_MANIFEST_VERSION = 1
+
+# URL prefix of the content-hashed image URLs
+ASSETS_PREFIX = "/assets"
+
+# Hex digits of the content hash used in image URLs
+URL_DIGEST_LENGTH = 16
+
+# Cache-Control of content-hashed URLs: the content behind a URL never
+# changes, so browsers and CDN edges may keep it for a year without revalidating
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def image_identity(entry: Optional[Dict[str, Any]]) -> Optional[Tuple[str, Optional[str]]]:
+    """Get what records embed of a manifest entry: its content hash and placeholder"""
+    return (entry["sha256"], entry.get("placeholder")) if entry is not None else None
+
+
+class ImageManifest:
+    """
+    Content hashes and placeholders of the source images.
+
+    Maps each image (relative to the images directory) to the SHA-256 of
+    its content and a low-quality placeholder. An image is served under a
+    URL containing its hash, so a changed image gets a new URL and every
+    URL can be cached forever. Refreshing stats every image and only
+    re-hashes those whose modification time or size changed; placeholders
+    are only rendered for new content.
+
+    The manifest is saved to ``path`` whenever it changes and loaded from
+    there on startup, so a restart neither re-hashes nor re-renders
+    anything. The file is only a cache and may be deleted at any time.
+
+    Args:
+        images_dir: Directory containing the products/ and users/ image directories
+        path: File the manifest is saved to (None to keep it in memory only)
+    """
+
+    def __init__(self, images_dir: str = IMAGES_DIR, path: Optional[str] = IMAGE_MANIFEST_PATH):
+        self.images_dir = os.path.abspath(images_dir)
+        self.path = Path(path) if path else None
+        self.images: Dict[str, Dict[str, Any]] = self._load()
+        self.version = ""
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Ignoring image manifest {self.path}: {e}")
+            return {}
+        if manifest.get("version") != IMAGE_MANIFEST_VERSION:
+            return {}
+        return manifest.get("images", {})
+
+    def _save(self):
+        manifest = {"version": IMAGE_MANIFEST_VERSION, "images": self.images}
+        try:
+            write_atomic(self.path, json.dumps(manifest, indent=1).encode())
+        except OSError as e:
+            # Saving only speeds up the next startup
+            print(f"Could not save image manifest {self.path}: {e}")
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        found: Dict[str, Tuple[int, int]] = {}
+        for root, dirs, files in os.walk(self.images_dir):
+            dirs.sort()
+            for name in sorted(files):
+                if not name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                relative = os.path.relpath(path, self.images_dir).replace(os.sep, "/")
+                found[relative] = (stat.st_mtime_ns, stat.st_size)
+        return found
+
+    def _placeholder(self, path: str) -> Optional[str]:
+        try:
+            return render_placeholder(Path(path))
+        except Exception as e:
+            # A broken image still gets its URL, only without a placeholder
+            print(f"Could not render placeholder of {path}: {e}")
+            return None
+
+    def refresh(self) -> Set[str]:
+        """
+        Re-scan the images directory, updating the version if any image changed.
+
+        Returns:
+            Relative paths of the images added, removed, or whose URL or
+            placeholder changed
+        """
+        placeholder_params = list(profile_params("placeholder", PLACEHOLDER_FORMAT))
+        with self._lock:
+            images: Dict[str, Dict[str, Any]] = {}
+            for relative, (mtime_ns, size) in self._scan().items():
+                entry = self.images.get(relative)
+                path = os.path.join(self.images_dir, relative)
+                if entry is None or entry["mtime_ns"] != mtime_ns or entry["size"] != size:
+                    sha256 = file_sha256(path)
+                    if entry is not None and entry["sha256"] == sha256:
+                        # Only touched: keep the placeholder
+                        entry = {**entry, "mtime_ns": mtime_ns, "size": size}
+                    else:
+                        entry = {"sha256": sha256, "mtime_ns": mtime_ns, "size": size}
+                if entry.get("placeholder_params") != placeholder_params:
+                    entry = {
+                        **entry,
+                        "placeholder": self._placeholder(path),
+                        "placeholder_params": placeholder_params
+                    }
+                images[relative] = entry
+
+            changed = images != self.images
+            changed_images = {
+                relative for relative in images.keys() | self.images.keys()
+                if image_identity(images.get(relative)) != image_identity(self.images.get(relative))
+            }
+            # Records embed both the URL and the placeholder, so the
+            # version covers both
+            digest = hashlib.sha1()
+            for relative, entry in images.items():
+                digest.update(f"{relative}\x1f{entry['sha256']}\x1f{entry['placeholder']}\n".encode())
+            self.images, self.version = images, digest.hexdigest()[:12]
+            if changed and self.path is not None:
+                self._save()
+            return changed_images
+
+    def relative(self, image_path: str) -> str:
+        """Get the path of an image file relative to the images directory"""
+        return os.path.relpath(os.path.abspath(image_path), self.images_dir).replace(os.sep, "/")
+
+    def digest(self, image_path: str) -> Optional[str]:
+        """
+        Get the URL digest of an image's current content.
+
+        Args:
+            image_path: Path of the image file
+
+        Returns:
+            The digest, or None if the image is not in the manifest
+        """
+        entry = self.images.get(self.relative(image_path))
+        return entry["sha256"][:URL_DIGEST_LENGTH] if entry is not None else None
+
+    def is_current(self, image_path: str, stat: os.stat_result) -> bool:
+        """Check whether an image file still has the modification time and size it was hashed with"""
+        entry = self.images.get(self.relative(image_path))
+        return entry is not None and (entry["mtime_ns"], entry["size"]) == (stat.st_mtime_ns, stat.st_size)
+
+    def placeholder(self, image_path: str) -> Optional[str]:
+        """
+        Get the placeholder of an image.
+
+        Args:
+            image_path: Path of the image file
+
+        Returns:
+            The placeholder as a data URI, or None if the image is not in
+            the manifest or could not be decoded
+        """
+        entry = self.images.get(self.relative(image_path))
+        return entry.get("placeholder") if entry is not None else None
+
+    def url(self, image_path: str) -> Optional[str]:
+        """
+        Get the content-hashed URL of an image.
+
+        Args:
+            image_path: Path of the image file
+
+        Returns:
+            URL of the form /assets/<digest>/products/<name>, or None if the
+            image is not in the manifest
+        """
+        relative = self.relative(image_path)
+        entry = self.images.get(relative)
+        if entry is None:
+            return None
+        return f"{ASSETS_PREFIX}/{entry['sha256'][:URL_DIGEST_LENGTH]}/{relative}"
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the number of images and the manifest version"""
+        return {"images": len(self.images), "version": self.version}
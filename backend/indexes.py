@@ -0,0 +1,379 @@
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+from bisect import bisect_left, bisect_right, insort
+import heapq
+import math
+import re
+
+# Bit offsets set in each possible byte value, used to walk bitmaps
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+_NONZERO_BYTE = re.compile(rb"[^\x00]")
+
+
+def bitmap_from_positions(positions: Iterator[int], size: int) -> int:
+    """
+    Build a bitmap with the given positions set.
+
+    Bitmaps are plain Python ints where bit ``n`` stands for the product at
+    catalog position ``n``, so intersections are ``&`` and counts are
+    ``int.bit_count()``, both running in C over machine words.
+
+    Args:
+        positions: Positions to set
+        size: Number of products in the catalog
+
+    Returns:
+        The bitmap as an int
+    """
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, "little")
+
+
+def intersect_bitmaps(bitmaps: Iterator[int]) -> Optional[int]:
+    """AND bitmaps together, returning None when there are none"""
+    result = None
+    for bitmap in bitmaps:
+        result = bitmap if result is None else result & bitmap
+    return result
+
+
+def bitmap_to_bytes(bitmap: int) -> bytes:
+    """
+    Get the little-endian bytes of a bitmap.
+
+    Position ``n`` is set when ``bits[n >> 3] >> (n & 7) & 1``, which tests
+    membership in O(1) instead of shifting the whole int.
+    """
+    return bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+
+
+def iter_bitmap(bitmap: int) -> Iterator[int]:
+    """
+    Iterate the positions set in a bitmap in ascending order.
+
+    Zero bytes are skipped by the regex engine, so sparse bitmaps are cheap
+    to walk even over a large catalog.
+    """
+    bits = bitmap_to_bytes(bitmap)
+    for match in _NONZERO_BYTE.finditer(bits):
+        index = match.start()
+        base = index << 3
+        for bit in _BYTE_BITS[bits[index]]:
+            yield base + bit
+
+
+class SortedIndex:
+    """
+    Presorted index over one product field.
+
+    Keeps the product positions ordered by field value so sorted listings
+    are served by slicing instead of sorting the catalog per request. Ties
+    are broken by catalog position in both directions, which matches a
+    stable sort of the catalog (including ``reverse=True``).
+
+    Args:
+        products: Products to index, in catalog order
+        field: Name of the field to sort by
+    """
+
+    def __init__(self, products: List[Dict[str, Any]], field: str):
+        self.field = field
+        # Ascending by (value, position)
+        self._asc = sorted((product[field], position) for position, product in enumerate(products))
+        # Ascending by (value, -position); read backwards it gives values
+        # descending with ties still in catalog order
+        self._desc = sorted((value, -position) for value, position in self._asc)
+
+    def __len__(self) -> int:
+        return len(self._asc)
+
+    def _bounds(
+        self,
+        reverse: bool,
+        after: Optional[Tuple[Any, Optional[int]]]
+    ) -> Tuple[int, int]:
+        if reverse:
+            keys = self._desc
+            end = len(keys)
+            if after is not None:
+                value, position = after
+                end = bisect_right(keys, (value, float("inf"))) if position is None \
+                    else bisect_left(keys, (value, -position))
+            return 0, end
+
+        keys = self._asc
+        start = 0
+        if after is not None:
+            value, position = after
+            start = bisect_left(keys, (value, -1)) if position is None \
+                else bisect_right(keys, (value, position))
+        return start, len(keys)
+
+    def positions(
+        self,
+        reverse: bool = False,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[Any, Optional[int]]] = None
+    ) -> List[int]:
+        """
+        Get product positions in sorted order.
+
+        Args:
+            reverse: Return positions in descending order of the field
+            limit: Only return the first ``limit`` positions (top-N)
+            after: Keyset to continue from, as (value, position) of the last
+                product already returned. A position of None (the product is
+                gone) continues with the first product having that value.
+
+        Returns:
+            List of positions into the indexed product list
+        """
+        start, end = self._bounds(reverse, after)
+        if reverse:
+            if limit is not None:
+                start = max(end - limit, start)
+            return [-position for _, position in reversed(self._desc[start:end])]
+        if limit is not None:
+            end = min(start + limit, end)
+        return [position for _, position in self._asc[start:end]]
+
+    def iter_positions(
+        self,
+        reverse: bool = False,
+        after: Optional[Tuple[Any, Optional[int]]] = None
+    ) -> Iterator[int]:
+        """Lazily iterate product positions in sorted order (see positions)"""
+        start, end = self._bounds(reverse, after)
+        if reverse:
+            keys = self._desc
+            for index in range(end - 1, start - 1, -1):
+                yield -keys[index][1]
+        else:
+            keys = self._asc
+            for index in range(start, end):
+                yield keys[index][1]
+
+    def update(self, position: int, old_value: Any, new_value: Any):
+        """
+        Move a product to its new place after its field value changed.
+
+        Args:
+            position: Catalog position of the product
+            old_value: Value the product was indexed under
+            new_value: New value of the field
+        """
+        if old_value == new_value:
+            return
+        for keys, key_position in ((self._asc, position), (self._desc, -position)):
+            index = bisect_left(keys, (old_value, key_position))
+            del keys[index]
+            insort(keys, (new_value, key_position))
+
+
+def top_positions(
+    products: List[Dict[str, Any]],
+    field: str,
+    positions: Iterator[int],
+    reverse: bool = False,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[Any, Optional[int]]] = None
+) -> List[int]:
+    """
+    Order a subset of products by a field without a prebuilt index.
+
+    Uses a bounded heap when only the first ``limit`` products are wanted,
+    so a page costs O(k log limit) over k candidates. Ordering and ``after``
+    semantics are the same as SortedIndex.positions.
+
+    Args:
+        products: Products in catalog order
+        field: Name of the field to sort by
+        positions: Positions of the candidate products
+        reverse: Order by descending field value
+        limit: Only return the first ``limit`` positions
+        after: Keyset to continue from, as (value, position)
+
+    Returns:
+        List of positions in sorted order
+    """
+    if reverse:
+        keys = [(products[position][field], -position) for position in positions]
+        if after is not None:
+            bound = (after[0], math.inf if after[1] is None else -after[1])
+            keys = [key for key in keys if key < bound]
+        keys = heapq.nlargest(limit, keys) if limit is not None else sorted(keys, reverse=True)
+        return [-position for _, position in keys]
+
+    keys = [(products[position][field], position) for position in positions]
+    if after is not None:
+        bound = (after[0], -1 if after[1] is None else after[1])
+        keys = [key for key in keys if key > bound]
+    keys = heapq.nsmallest(limit, keys) if limit is not None else sorted(keys)
+    return [position for _, position in keys]
+
+
+class BitmapIndex:
+    """
+    Bitmap per distinct value of a product attribute.
+
+    Args:
+        products: Products to index, in catalog order
+        key: Function returning the indexed value of a product
+    """
+
+    def __init__(self, products: List[Dict[str, Any]], key: Callable[[Dict[str, Any]], Any]):
+        self.key = key
+        positions: Dict[Any, List[int]] = {}
+        for position, product in enumerate(products):
+            positions.setdefault(key(product), []).append(position)
+        self.bitmaps: Dict[Any, int] = {
+            value: bitmap_from_positions(value_positions, len(products))
+            for value, value_positions in positions.items()
+        }
+
+    def get(self, value: Any) -> int:
+        """Get the bitmap for a value (0 when no product has it)"""
+        return self.bitmaps.get(value, 0)
+
+    def union(self, values: List[Any]) -> int:
+        """Get the bitmap of products having any of the given values"""
+        bitmap = 0
+        for value in values:
+            bitmap |= self.get(value)
+        return bitmap
+
+    def counts(self, bitmap: Optional[int] = None) -> Dict[Any, int]:
+        """
+        Count products per value.
+
+        Args:
+            bitmap: Only count products in this bitmap (None for all products)
+
+        Returns:
+            Dictionary of value -> number of products
+        """
+        if bitmap is None:
+            return {value: value_bitmap.bit_count() for value, value_bitmap in self.bitmaps.items()}
+        return {value: (value_bitmap & bitmap).bit_count() for value, value_bitmap in self.bitmaps.items()}
+
+    def update(self, position: int, old_value: Any, new_value: Any):
+        """Move a product from one value's bitmap to another's"""
+        if old_value == new_value:
+            return
+        bit = 1 << position
+        self.bitmaps[old_value] = self.bitmaps.get(old_value, 0) & ~bit
+        self.bitmaps[new_value] = self.bitmaps.get(new_value, 0) | bit
+
+
+class RangeBitmapIndex:
+    """
+    Binned bitmap index for range queries over a numeric field.
+
+    Values are grouped into fixed-width bins with one bitmap each. A range
+    query ORs the bins that lie completely inside the range and only looks
+    up the products of the (at most two) partial edge bins, using a sorted
+    array of (value, position).
+
+    Args:
+        products: Products to index, in catalog order
+        field: Name of the numeric field
+        bin_width: Width of each bin
+    """
+
+    def __init__(self, products: List[Dict[str, Any]], field: str, bin_width: float):
+        self.field = field
+        self.bin_width = bin_width
+        self.size = len(products)
+        self._sorted = sorted((product[field], position) for position, product in enumerate(products))
+        self.bins = BitmapIndex(products, lambda product: self.bin_of(product[field]))
+
+    def bin_of(self, value: float) -> int:
+        """Get the number of the bin a value falls into"""
+        return math.floor(value / self.bin_width)
+
+    def _slice_bitmap(self, low: float, high: float, include_high: bool) -> int:
+        start = bisect_left(self._sorted, (low, -1))
+        if include_high:
+            end = bisect_right(self._sorted, (high, math.inf))
+        else:
+            end = bisect_left(self._sorted, (high, -1))
+        if start >= end:
+            return 0
+        return bitmap_from_positions(
+            (position for _, position in self._sorted[start:end]), self.size
+        )
+
+    def range(self, low: Optional[float] = None, high: Optional[float] = None) -> int:
+        """
+        Get the bitmap of products with low <= value <= high.
+
+        Args:
+            low: Lower bound (None for unbounded)
+            high: Upper bound (None for unbounded)
+
+        Returns:
+            The bitmap of matching products
+        """
+        if not self._sorted:
+            return 0
+        # Clamp to the values present so open-ended ranges touch few bins
+        low = self._sorted[0][0] if low is None else max(low, self._sorted[0][0])
+        high = self._sorted[-1][0] if high is None else min(high, self._sorted[-1][0])
+        if low > high:
+            return 0
+
+        # Bins entirely inside [low, high]
+        first_full = math.ceil(low / self.bin_width)
+        last_full = math.floor(high / self.bin_width) - 1
+        if first_full > last_full:
+            return self._slice_bitmap(low, high, include_high=True)
+
+        bitmap = 0
+        for bin_number in range(first_full, last_full + 1):
+            bitmap |= self.bins.get(bin_number)
+        bitmap |= self._slice_bitmap(low, first_full * self.bin_width, include_high=False)
+        bitmap |= self._slice_bitmap((last_full + 1) * self.bin_width, high, include_high=True)
+        return bitmap
+
+    def bucket_counts(
+        self,
+        bucket_width: float,
+        bitmap: Optional[int] = None
+    ) -> List[Tuple[float, float, int]]:
+        """
+        Count products per fixed-width value bucket by merging bins.
+
+        Args:
+            bucket_width: Width of each bucket, a multiple of the bin width
+            bitmap: Only count products in this bitmap (None for all products)
+
+        Returns:
+            List of (bucket start, bucket end, count), covering every bucket
+            from the lowest to the highest value in the index. Bucket starts
+            are inclusive and ends exclusive.
+
+        Raises:
+            ValueError: If bucket_width is not a positive multiple of the bin width
+        """
+        bins_per_bucket = bucket_width / self.bin_width
+        if bins_per_bucket < 1 or bins_per_bucket != int(bins_per_bucket):
+            raise ValueError(f"Bucket width must be a multiple of {self.bin_width:g}")
+        bins_per_bucket = int(bins_per_bucket)
+        if not self._sorted:
+            return []
+
+        buckets: Dict[int, int] = {}
+        for bin_number, bin_bitmap in self.bins.bitmaps.items():
+            bucket = bin_number // bins_per_bucket
+            buckets[bucket] = buckets.get(bucket, 0) | bin_bitmap
+
+        first = self.bin_of(self._sorted[0][0]) // bins_per_bucket
+        last = self.bin_of(self._sorted[-1][0]) // bins_per_bucket
+        counts = []
+        for bucket in range(first, last + 1):
+            bucket_bitmap = buckets.get(bucket, 0)
+            if bitmap is not None:
+                bucket_bitmap &= bitmap
+            counts.append((bucket * bucket_width, (bucket + 1) * bucket_width, bucket_bitmap.bit_count()))
+        return counts
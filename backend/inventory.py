@@ -0,0 +1,463 @@
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
+import os
+import time
+
+from files import write_atomic
+from serialization import encode_json
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# Write-ahead log of stock changes, next to the product database
+INVENTORY_LOG_PATH = os.environ.get("INVENTORY_LOG_PATH", "../db/inventory.wal")
+
+# Seconds a log write waits for more changes to share its fsync (0: only
+# the changes arriving during the previous fsync are batched)
+INVENTORY_FLUSH_DELAY = float(os.environ.get("INVENTORY_FLUSH_DELAY", "0"))
+
+# Seconds between compactions of the log into the product database
+INVENTORY_COMPACT_INTERVAL = float(os.environ.get("INVENTORY_COMPACT_INTERVAL", "60"))
+
+
+class InventoryUnavailable(Exception):
+    """Raised when stock changes cannot be logged"""
+
+
+def write_all(fd: int, data: bytes):
+    """Write all of data to a file descriptor"""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+class InventoryLog:
+    """
+    Append-only write-ahead log of stock changes.
+
+    Each change is a JSON line holding a sequence number, the product id
+    and its new stock level. Lines hold absolute levels, so replaying a
+    change twice is harmless. A change is acknowledged once its line is on
+    disk: changes arriving while a write is in progress are batched into
+    the next write, so one fsync covers many changes under load. If a
+    write fails, its changes and every change queued behind it (which may
+    build on them) are undone, newest first, and their callers get
+    InventoryUnavailable.
+
+    Compaction writes the product database with the current stock levels
+    and the sequence number they include (``metadata.inventory_seq``),
+    renames it into place and then empties the log. A product database
+    loaded later only needs the changes after its sequence number, which
+    are kept in memory per product.
+
+    Only one process may write the log; the others can still replay it.
+
+    Args:
+        path: File the log is kept in
+        flush_delay: Seconds a write waits for more changes to batch
+    """
+
+    def __init__(self, path: str = INVENTORY_LOG_PATH, flush_delay: float = INVENTORY_FLUSH_DELAY):
+        self.path = path
+        self.flush_delay = flush_delay
+        # Last stock change per product: product id -> (sequence number, stock)
+        self.latest: Dict[str, Tuple[int, int]] = {}
+        self.seq = 0
+        self.writable = False
+        self._fd: Optional[int] = None
+        self._opened = False
+        # Changes not written yet: (sequence number, product id, encoded
+        # line, previous latest entry, undo callback), and their callers
+        self._pending: List[Tuple[int, str, bytes, Optional[Tuple[int, int]], Optional[Callable[[], None]]]] = []
+        self._waiters: List[asyncio.Future] = []
+        self._flusher: Optional[asyncio.Task] = None
+        # All file writes happen on this thread, in submission order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inventory")
+        # Only touched from the event loop thread, except records (writer thread)
+        self.records = 0
+        self.flushes = 0
+        self.written = 0
+        self.failed = 0
+        self.compactions = 0
+
+    def open(self):
+        """Open the log and read its changes, once (later calls do nothing)"""
+        if self._opened:
+            return
+        self._opened = True
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        except OSError as e:
+            print(f"Could not open inventory log {self.path}: {e}")
+            return
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Another worker process owns the log: replay it, never write it
+                self._read(fd, truncate=False)
+                os.close(fd)
+                print(f"Inventory log {self.path} is written by another process")
+                return
+        self._read(fd, truncate=True)
+        self._fd = fd
+        self.writable = True
+
+    def _read(self, fd: int, truncate: bool):
+        with open(fd, "rb", closefd=False) as f:
+            f.seek(0)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data) and truncate:
+            # A crash in the middle of a write leaves a partial last line
+            print(f"Dropping {len(data) - end} bytes of a partial change from {self.path}")
+            os.ftruncate(fd, end)
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+                seq, product_id, stock = record["seq"], record["id"], record["stock"]
+            except (ValueError, KeyError, TypeError):
+                print(f"Skipping unreadable inventory log line: {line[:80]!r}")
+                continue
+            self.records += 1
+            self.seq = max(self.seq, seq)
+            if seq > self.latest.get(product_id, (0, 0))[0]:
+                self.latest[product_id] = (seq, stock)
+
+    def replay(self, table) -> int:
+        """
+        Apply the logged stock changes a freshly loaded product table does not include yet.
+
+        Args:
+            table: ProductTable loaded from the product database
+
+        Returns:
+            Number of products whose stock was changed
+        """
+        self.open()
+        after = table.metadata.get("inventory_seq", 0)
+        # New changes must sort after everything the database includes
+        self.seq = max(self.seq, after)
+        changed = 0
+        for product_id, (seq, stock) in self.latest.items():
+            product = table.get(product_id)
+            if seq > after and product is not None and product["stock"] != stock:
+                table.set_stock(product_id, stock)
+                changed += 1
+        return changed
+
+    async def append(
+        self, product_id: str, stock: int, undo: Optional[Callable[[], None]] = None, **details: Any
+    ) -> int:
+        """
+        Log the new stock level of a product and wait until it is on disk.
+
+        The change is sequenced as soon as this is called, so callers
+        should apply it in memory right before, without awaiting in between.
+
+        Args:
+            product_id: The unique identifier of the product
+            stock: New stock level
+            undo: Called if the change cannot be written, to revert it in memory
+            **details: Extra fields stored with the change (e.g. the operation)
+
+        Returns:
+            Sequence number of the change
+
+        Raises:
+            InventoryUnavailable: If the log cannot be written
+        """
+        self.open()
+        if not self.writable:
+            raise InventoryUnavailable("The inventory log is not writable by this process")
+        self.seq += 1
+        seq = self.seq
+        line = encode_json({"seq": seq, "id": product_id, "stock": stock, **details}) + b"\n"
+        self._pending.append((seq, product_id, line, self.latest.get(product_id), undo))
+        self.latest[product_id] = (seq, stock)
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        if self._flusher is None:
+            self._flusher = loop.create_task(self._flush())
+        await waiter
+        return seq
+
+    async def _flush(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending:
+                if self.flush_delay > 0:
+                    await asyncio.sleep(self.flush_delay)
+                batch, waiters = self._pending, self._waiters
+                self._pending, self._waiters = [], []
+                try:
+                    data = b"".join(change[2] for change in batch)
+                    await loop.run_in_executor(self._executor, self._write, data, len(batch))
+                except OSError as e:
+                    # Changes queued meanwhile may build on the failed ones
+                    batch += self._pending
+                    waiters += self._waiters
+                    self._pending, self._waiters = [], []
+                    self._undo(batch)
+                    error = InventoryUnavailable(f"Could not write the inventory log: {e}")
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_exception(error)
+                    continue
+                self.flushes += 1
+                self.written += len(batch)
+                for waiter in waiters:
+                    # A caller may have gone away (e.g. a disconnected client)
+                    if not waiter.done():
+                        waiter.set_result(None)
+        finally:
+            self._flusher = None
+
+    def _undo(self, changes):
+        self.failed += len(changes)
+        for seq, product_id, _, previous, undo in reversed(changes):
+            if self.latest.get(product_id, (0, 0))[0] == seq:
+                if previous is None:
+                    del self.latest[product_id]
+                else:
+                    self.latest[product_id] = previous
+            if undo is not None:
+                undo()
+
+    def _write(self, data: bytes, records: int):
+        offset = os.lseek(self._fd, 0, os.SEEK_END)
+        try:
+            write_all(self._fd, data)
+            os.fsync(self._fd)
+        except OSError:
+            # Never leave a partial line for later changes to follow
+            try:
+                os.ftruncate(self._fd, offset)
+            except OSError:
+                pass
+            raise
+        self.records += records
+
+    async def compact(self, path: str, data: Dict[str, Any]):
+        """
+        Write the product database including every logged change, then empty the log.
+
+        Args:
+            path: Path of the product database file
+            data: Contents to write, whose metadata.inventory_seq must be the
+                sequence number of the last change they include
+        """
+        seq = data["metadata"]["inventory_seq"]
+        loop = asyncio.get_running_loop()
+        # Runs after every write queued so far, so the log holds no change
+        # the new database lacks when it is emptied
+        await loop.run_in_executor(self._executor, self._compact, path, json.dumps(data, indent=2).encode())
+        self.compactions += 1
+        # Changes up to seq are in the database now
+        self.latest = {
+            product_id: change for product_id, change in self.latest.items() if change[0] > seq
+        }
+
+    def _compact(self, path: str, contents: bytes):
+        # The database and its rename must be on disk before the log is dropped
+        write_atomic(path, contents, durable=True)
+        os.ftruncate(self._fd, 0)
+        os.fsync(self._fd)
+        self.records = 0
+
+    async def drain(self):
+        """Wait until no change is waiting to be written"""
+        while self._flusher is not None:
+            await asyncio.shield(self._flusher)
+
+    @property
+    def pending(self) -> int:
+        """Number of changes waiting to be written"""
+        return len(self._pending)
+
+    async def close(self):
+        """Wait for the pending writes, then close the log"""
+        await self.drain()
+        self._executor.shutdown(wait=True)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self.writable = False
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the log position, size and write counters"""
+        return {
+            "path": self.path,
+            "writable": self.writable,
+            "seq": self.seq,
+            "records": self.records,
+            "pending": self.pending,
+            "flushes": self.flushes,
+            "written": self.written,
+            "failed": self.failed,
+            "compactions": self.compactions
+        }
+
+
+class Inventory:
+    """
+    Stock changes of the catalog: adjust, reserve and release.
+
+    Changes are applied to the in-memory product table (bumping its
+    revision, so cached listings and ETags follow) and logged to the
+    catalog's InventoryLog before they are acknowledged. A background task
+    compacts the log into the product database every ``compact_interval``
+    seconds while it holds changes, so the database file is rewritten at
+    most that often however many changes arrive. A change whose write
+    fails is reverted in memory, and a compaction first waits for the
+    changes being written, so neither the catalog nor the database keeps
+    a stock level the log rejected.
+
+    Reservations are not tracked per order: reserving takes units out of
+    stock only if enough are available, and releasing puts units back like
+    a positive adjustment.
+
+    Args:
+        store: CatalogStore whose products are changed
+        compact_interval: Seconds between compactions (0 disables them)
+    """
+
+    def __init__(self, store, compact_interval: float = INVENTORY_COMPACT_INTERVAL):
+        self.store = store
+        self.log: InventoryLog = store.inventory
+        self.compact_interval = compact_interval
+        self._task: Optional[asyncio.Task] = None
+        self._compacting = False
+        # Set when a failed change could not be reverted in memory, so the
+        # next compaction saves the levels being served
+        self._unsaved = False
+        self.last_compaction_ms: Optional[float] = None
+
+    async def change(self, product_id: str, op: str, update: Callable[[int], int]) -> Tuple[Dict[str, Any], int]:
+        """
+        Change the stock of a product and log it.
+
+        Args:
+            product_id: The unique identifier of the product
+            op: Name of the operation, stored in the log
+            update: Function computing the new stock level from the current one
+
+        Returns:
+            The updated product and the sequence number of the change
+
+        Raises:
+            KeyError: If the product does not exist
+            ValueError: If the new stock level would be negative
+            InventoryUnavailable: If the change cannot be logged; the stock
+                level is reverted
+        """
+        self.log.open()
+        if not self.log.writable:
+            raise InventoryUnavailable("The inventory log is not writable by this process")
+        table = self.store.snapshot().products
+        product = table.get(product_id)
+        if product is None:
+            raise KeyError(product_id)
+        previous = product["stock"]
+        stock = update(previous)
+        if stock < 0:
+            raise ValueError(f"Only {previous} in stock")
+        table.set_stock(product_id, stock)
+
+        def undo():
+            # The table may have been reloaded since, with the change replayed
+            current = self.store.snapshot().products
+            changed = current.get(product_id)
+            if changed is not None and changed["stock"] == stock:
+                current.set_stock(product_id, previous)
+            else:
+                self._unsaved = True
+
+        seq = await self.log.append(product_id, stock, undo, op=op, delta=stock - previous)
+        return product, seq
+
+    async def adjust(self, product_id: str, delta: int) -> Tuple[Dict[str, Any], int]:
+        """Add delta (which may be negative) to the stock of a product"""
+        return await self.change(product_id, "adjust", lambda stock: stock + delta)
+
+    async def reserve(self, product_id: str, quantity: int) -> Tuple[Dict[str, Any], int]:
+        """Take quantity units out of stock, failing if fewer are available"""
+        return await self.change(product_id, "reserve", lambda stock: stock - quantity)
+
+    async def release(self, product_id: str, quantity: int) -> Tuple[Dict[str, Any], int]:
+        """Put quantity units back in stock (the same as adjusting by quantity)"""
+        return await self.change(product_id, "release", lambda stock: stock + quantity)
+
+    async def compact(self) -> bool:
+        """
+        Compact the log into the product database if it holds any change,
+        or the served stock levels differ from the logged ones.
+
+        Returns:
+            Whether a compaction ran
+        """
+        if self._compacting or not self.log.writable:
+            return False
+        self._compacting = True
+        try:
+            started = time.perf_counter()
+            # A change still being written may fail and be reverted, so the
+            # database must only be written once every change is on disk
+            await self.log.drain()
+            if self.log.records == 0 and not self._unsaved:
+                return False
+            table = self.store.snapshot().products
+            # Taken without awaiting after the drain, so the data includes
+            # exactly the logged changes up to seq
+            data = table.to_data(inventory_seq=self.log.seq)
+            self._unsaved = False
+            try:
+                await self.log.compact(self.store.products_path, data)
+            except BaseException:
+                self._unsaved = True
+                raise
+            self.store.mark_current(self.store.products_path)
+            self.last_compaction_ms = (time.perf_counter() - started) * 1000
+            return True
+        finally:
+            self._compacting = False
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.compact_interval)
+            try:
+                await self.compact()
+            except Exception as e:
+                # The log keeps every change, so the next run can try again
+                print(f"Inventory compaction failed: {str(e)}")
+
+    def start(self):
+        """Start the compaction task (call from the running event loop)"""
+        if self._task is None and self.compact_interval > 0:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the compaction task and close the log after the pending writes"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.log.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the log statistics and the duration of the last compaction"""
+        return {
+            **self.log.stats(),
+            "compact_interval": self.compact_interval,
+            "unsaved": self._unsaved,
+            "last_compaction_ms": self.last_compaction_ms
+        }
@@ -0,0 +1,173 @@
+"""
+Tests of the inventory write-ahead log: replay after a restart, and that a
+change whose log write fails is reverted and never saved by a compaction.
+
+Runs without a server, on copies of the databases in a temporary directory.
+
+Usage (from the backend directory):
+    python inventory_test.py
+"""
+from typing import Callable, List, Tuple
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Keep the image manifest of the test catalogs out of the repository's db/
+os.environ.setdefault("IMAGE_MANIFEST_PATH", os.path.join(tempfile.gettempdir(), "inventory_test_manifest.json"))
+
+from catalog import CatalogStore
+from inventory import Inventory, InventoryLog, InventoryUnavailable
+
+DB_DIR = "../db"
+PRODUCT_ID = "7"
+
+
+def open_inventory(directory: str) -> Inventory:
+    """Load the catalog copies in directory, as a server process starting up would"""
+    store = CatalogStore(
+        products_path=os.path.join(directory, "product_database.json"),
+        users_path=os.path.join(directory, "users_database.json"),
+        inventory_log=InventoryLog(os.path.join(directory, "inventory.wal"))
+    )
+    store.reload()
+    return Inventory(store, compact_interval=0)
+
+
+def stock_on_disk(inventory: Inventory, product_id: str) -> int:
+    """Get the stock of a product in the product database file"""
+    with open(inventory.store.products_path) as f:
+        products = json.load(f)["products"]
+    return next(product["stock"] for product in products if product["id"] == product_id)
+
+
+def stock_in_memory(inventory: Inventory, product_id: str) -> int:
+    """Get the stock of a product as served"""
+    return inventory.store.snapshot().products.get(product_id)["stock"]
+
+
+def failing_write(delay: float) -> Callable[[bytes, int], None]:
+    """Replacement for InventoryLog._write that fails like a full disk, after delay seconds"""
+    def write(data: bytes, records: int):
+        time.sleep(delay)
+        raise OSError(28, "No space left on device")
+    return write
+
+
+async def replay_after_restart(directory: str):
+    inventory = open_inventory(directory)
+    before = stock_in_memory(inventory, PRODUCT_ID)
+    await inventory.adjust(PRODUCT_ID, -3)
+    await inventory.stop()
+
+    # The database was not compacted: the change only survives in the log
+    restarted = open_inventory(directory)
+    assert stock_on_disk(restarted, PRODUCT_ID) == before
+    assert stock_in_memory(restarted, PRODUCT_ID) == before - 3
+    await restarted.stop()
+
+
+async def failed_write_is_reverted(directory: str):
+    inventory = open_inventory(directory)
+    before = stock_in_memory(inventory, PRODUCT_ID)
+    inventory.log._write = failing_write(0.05)
+
+    # Changes queued behind the failing one build on it and fail with it
+    results = await asyncio.gather(
+        *(inventory.adjust(PRODUCT_ID, delta) for delta in (5, -2, 7)),
+        return_exceptions=True
+    )
+    assert all(isinstance(result, InventoryUnavailable) for result in results)
+    assert stock_in_memory(inventory, PRODUCT_ID) == before
+    assert PRODUCT_ID not in inventory.log.latest
+    await inventory.stop()
+
+
+async def failed_write_is_not_compacted(directory: str):
+    inventory = open_inventory(directory)
+    before = stock_in_memory(inventory, PRODUCT_ID)
+    # A logged change elsewhere gives the compaction something to save
+    await inventory.adjust("8", 1)
+
+    inventory.log._write = failing_write(0.3)
+    change = asyncio.ensure_future(inventory.adjust(PRODUCT_ID, -5))
+    await asyncio.sleep(0.05)
+    # Starts while the failing write is in progress
+    compacted = await inventory.compact()
+    try:
+        await change
+        raise AssertionError("The change was acknowledged although its write failed")
+    except InventoryUnavailable:
+        pass
+
+    assert compacted
+    assert stock_in_memory(inventory, PRODUCT_ID) == before
+    assert stock_on_disk(inventory, PRODUCT_ID) == before
+    await inventory.stop()
+
+    restarted = open_inventory(directory)
+    assert stock_in_memory(restarted, PRODUCT_ID) == before
+    await restarted.stop()
+
+
+async def compaction_keeps_file_mode(directory: str):
+    path = os.path.join(directory, "product_database.json")
+    os.chmod(path, 0o644)
+    inventory = open_inventory(directory)
+    await inventory.adjust(PRODUCT_ID, 1)
+    assert await inventory.compact()
+    assert os.stat(path).st_mode & 0o777 == 0o644
+    await inventory.stop()
+
+
+TESTS: List[Tuple[str, Callable]] = [
+    ("replay after restart", replay_after_restart),
+    ("failed write is reverted", failed_write_is_reverted),
+    ("failed write is not compacted", failed_write_is_not_compacted),
+    ("compaction keeps the file mode", compaction_keeps_file_mode),
+]
+
+
+def run(test: Callable):
+    """Run a test on fresh copies of the databases"""
+    directory = tempfile.mkdtemp(prefix="inventory-test-")
+    try:
+        for name in ("product_database.json", "users_database.json"):
+            shutil.copy(os.path.join(DB_DIR, name), directory)
+        asyncio.run(test(directory))
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_replay_after_restart():
+    run(replay_after_restart)
+
+
+def test_failed_write_is_reverted():
+    run(failed_write_is_reverted)
+
+
+def test_failed_write_is_not_compacted():
+    run(failed_write_is_not_compacted)
+
+
+def test_compaction_keeps_file_mode():
+    run(compaction_keeps_file_mode)
+
+
+if __name__ == "__main__":
+    print("--- Fashionary Inventory Test ---")
+    failed = 0
+    for name, test in TESTS:
+        try:
+            run(test)
+            print(f"  {name}: PASS")
+        except Exception as e:
+            failed += 1
+            print(f"  {name}: FAIL ({type(e).__name__}: {e})")
+    print("--- Test Summary ---")
+    print(f"Total: {len(TESTS)} | Passed: {len(TESTS) - failed} | Failed: {failed}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,125 @@
+from typing import Dict, Any, Callable, Iterable, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import asyncio
+
+from concurrency import lower_thread_priority
+
+# A rendition to prefetch: (image path, profile, format)
+PrefetchJob = Tuple[Path, str, str]
+
+
+class Prefetcher:
+    """
+    Background warmer of the rendition cache, at low priority.
+
+    Endpoints submit the renditions a client is likely to ask for next;
+    a single background task loads them one at a time on its own thread.
+    Before each job it waits until the foreground image pool is idle, so
+    prefetching only uses otherwise idle time and never delays a request.
+
+    Jobs are deduplicated while queued. When the queue is full the oldest
+    jobs are dropped: recent submissions are the likeliest to be needed.
+
+    Args:
+        warm: Blocking function loading one rendition, returning whether it
+            was actually loaded (False if it was already cached)
+        busy: Function telling whether foreground image work is in progress
+        max_queue: Number of jobs kept waiting (0 disables prefetching)
+        idle_poll: Seconds between checks while the foreground is busy
+        nice: Niceness added to the prefetch thread
+    """
+
+    def __init__(
+        self,
+        warm: Callable[[Path, str, str], bool],
+        busy: Callable[[], bool],
+        max_queue: int,
+        idle_poll: float = 0.05,
+        nice: int = 0
+    ):
+        self.warm = warm
+        self.busy = busy
+        self.max_queue = max_queue
+        self.idle_poll = idle_poll
+        self._queue: "OrderedDict[PrefetchJob, None]" = OrderedDict()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="prefetch", initializer=lower_thread_priority, initargs=(nice,)
+        )
+        self._task = None
+        # Only touched from the event loop thread, so no lock is needed
+        self.submitted = 0
+        self.dropped = 0
+        self.loaded = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def submit(self, jobs: Iterable[PrefetchJob]):
+        """Queue renditions to prefetch (non-blocking)"""
+        if self.max_queue <= 0:
+            return
+        for job in jobs:
+            if job in self._queue:
+                continue
+            self._queue[job] = None
+            self.submitted += 1
+            if len(self._queue) > self.max_queue:
+                self._queue.popitem(last=False)
+                self.dropped += 1
+        if self._queue and self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        """Start the background task (call from the running event loop)"""
+        if self._task is None and self.max_queue > 0:
+            # Created here, as an event belongs to the loop that waits on it
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task, dropping the queued jobs"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._queue.clear()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            # Yield to foreground image work
+            while self.busy():
+                await asyncio.sleep(self.idle_poll)
+            if not self._queue:
+                continue
+            job, _ = self._queue.popitem(last=False)
+            try:
+                if await loop.run_in_executor(self._executor, self.warm, *job):
+                    self.loaded += 1
+                else:
+                    self.skipped += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Prefetch of {job} failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the queue depth and job counters"""
+        return {
+            "max_queue": self.max_queue,
+            "queued": len(self._queue),
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "loaded": self.loaded,
+            "skipped": self.skipped,
+            "failed": self.failed
+        }
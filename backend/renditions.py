@@ -0,0 +1,303 @@
+from typing import Dict, Any, List, Optional, Tuple
+from pathlib import Path
+from PIL import Image
+import base64
+import hashlib
+import io
+import json
+import os
+
+# Renditions served by the API. max_size bounds the longest side in pixels;
+# images are never upscaled. formats maps each output format to its encoder
+# quality, JPEG first as the fallback. A rendition larger than max_bytes
+# (None for no target) is re-encoded at lower qualities, down to
+# MIN_QUALITY, until it fits. Run benchmark_renditions.py after changing them
+RENDITION_PROFILES: Dict[str, Dict[str, Any]] = {
+    # Product detail view and the /products/{id}/display image
+    "detail": {"max_size": 800, "max_bytes": 96 * 1024, "formats": {"JPEG": 85, "WEBP": 80, "AVIF": 60}},
+    # Product grid thumbnails
+    "grid": {"max_size": 300, "max_bytes": 16 * 1024, "formats": {"JPEG": 80, "WEBP": 75, "AVIF": 55}},
+    # User profile pictures and the /users/{id}/display image
+    "avatar": {"max_size": 400, "max_bytes": 24 * 1024, "formats": {"JPEG": 85, "WEBP": 80, "AVIF": 60}},
+    # Blurred stand-in embedded in listings until the real image loads;
+    # about 160 bytes as WebP (700 as JPEG)
+    "placeholder": {"max_size": 24, "max_bytes": None, "formats": {"JPEG": 30, "WEBP": 50}},
+}
+
+# Lowest quality a size target may push an encoding to, and the step
+MIN_QUALITY = 50
+QUALITY_STEP = 5
+
+# Profiles of each image directory, smallest first. These are built by
+# build_renditions.py and served by the /image and /display endpoints
+PROFILES_BY_KIND: Dict[str, Tuple[str, ...]] = {
+    "products": ("grid", "detail"),
+    "users": ("avatar",),
+}
+
+FORMAT_EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp", "AVIF": ".avif"}
+FORMAT_MEDIA_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "AVIF": "image/avif"}
+
+IMAGES_DIR = os.environ.get("IMAGES_DIR", "../images")
+# Source image files, by extension (lowercase)
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+PREBUILT_DIR = os.environ.get("PREBUILT_RENDITIONS_DIR", "../.cache/prebuilt")
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 2
+
+
+def _can_encode(format: str) -> bool:
+    try:
+        Image.new("RGB", (1, 1)).save(io.BytesIO(), format=format)
+    except (KeyError, OSError, ValueError):
+        return False
+    return True
+
+
+# Output formats the installed Pillow can encode (WebP and AVIF depend on
+# how it was built)
+SUPPORTED_FORMATS: Tuple[str, ...] = tuple(
+    format for format in FORMAT_MEDIA_TYPES if format == "JPEG" or _can_encode(format)
+)
+
+
+def profile_formats(profile: str) -> List[str]:
+    """Get the output formats of a profile that can be encoded here"""
+    return [format for format in RENDITION_PROFILES[profile]["formats"] if format in SUPPORTED_FORMATS]
+
+
+# Placeholders are embedded in listings as they are, so they use the
+# smallest format every browser displays
+PLACEHOLDER_FORMAT = "WEBP" if "WEBP" in profile_formats("placeholder") else "JPEG"
+
+
+def profile_params(profile: str, format: str = "JPEG") -> Tuple:
+    """
+    Get the parameters of a rendition as a hashable tuple.
+
+    Raises:
+        KeyError: If the profile does not exist or has no such format
+    """
+    spec = RENDITION_PROFILES[profile]
+    return (spec["max_size"], format, spec["formats"][format], spec["max_bytes"])
+
+
+def profile_for_width(kind: str, width: Optional[int]) -> str:
+    """
+    Pick the /image profile for a requested width.
+
+    Widths are snapped to the profile sizes, so only a few renditions per
+    image exist: the smallest profile at least as wide as requested, or the
+    largest one. Without a width the largest profile is used.
+
+    Args:
+        kind: Image directory, "products" or "users"
+        width: Requested width in pixels (None for no preference)
+    """
+    profiles = PROFILES_BY_KIND[kind]
+    if width is not None:
+        for profile in profiles:
+            if RENDITION_PROFILES[profile]["max_size"] >= width:
+                return profile
+    return profiles[-1]
+
+
+def negotiate_image_format(accept: Optional[str], profile: str) -> str:
+    """
+    Pick the output format for a request from its Accept header.
+
+    AVIF is preferred over WebP when the client lists it explicitly;
+    everything else gets JPEG, which every client can display.
+
+    Args:
+        accept: Accept header value (None if absent)
+        profile: Name of the rendition profile
+    """
+    accepted = set()
+    for item in (accept or "").split(","):
+        media_type, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(media_type.strip().lower())
+
+    formats = profile_formats(profile)
+    for format in ("AVIF", "WEBP"):
+        if format in formats and FORMAT_MEDIA_TYPES[format] in accepted:
+            return format
+    return "JPEG"
+
+
+def draft(img: Image.Image, max_size: int):
+    """
+    Let a JPEG decode at a reduced scale, for downscaling to max_size.
+
+    JPEG decoders can skip detail and decode at 1/2, 1/4 or 1/8 of the
+    size, which is several times faster than a full decode. The largest
+    reduction that keeps the image at least as large as the target is
+    used, so the final resize still has enough pixels. Must be called
+    before the image is loaded; other formats are decoded in full.
+    """
+    if max(img.size) > max_size:
+        ratio = max_size / max(img.size)
+        img.draft("RGB", tuple(max(1, int(dim * ratio)) for dim in img.size))
+
+
+def render_image(img: Image.Image, profile: str, format: str = "JPEG") -> bytes:
+    """
+    Encode an opened image with a rendition profile.
+
+    Args:
+        img: Source image
+        profile: Name of the rendition profile
+        format: Output format of the profile
+
+    Returns:
+        The encoded rendition
+    """
+    max_size, format, quality, max_bytes = profile_params(profile, format)
+    # Convert image to RGB if it's not
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    # Resize image if it's larger than the profile allows
+    if max(img.size) > max_size:
+        ratio = max_size / max(img.size)
+        new_size = tuple(max(1, int(dim * ratio)) for dim in img.size)
+        img = img.resize(new_size, Image.Resampling.LANCZOS)
+
+    while True:
+        buffered = io.BytesIO()
+        img.save(buffered, format=format, quality=quality)
+        data = buffered.getvalue()
+        if max_bytes is None or len(data) <= max_bytes or quality <= MIN_QUALITY:
+            return data
+        quality = max(MIN_QUALITY, quality - QUALITY_STEP)
+
+
+def render_rendition(image_path: Path, profile: str, format: str = "JPEG") -> bytes:
+    """Open an image file and encode it with a rendition profile"""
+    with Image.open(image_path) as img:
+        draft(img, RENDITION_PROFILES[profile]["max_size"])
+        return render_image(img, profile, format)
+
+
+def render_placeholder(image_path: Path) -> str:
+    """
+    Render the low-quality placeholder of an image.
+
+    Returns:
+        The placeholder as a data URI in PLACEHOLDER_FORMAT
+    """
+    format = PLACEHOLDER_FORMAT
+    with Image.open(image_path) as img:
+        draft(img, RENDITION_PROFILES["placeholder"]["max_size"])
+        data = render_image(img, "placeholder", format)
+    return f"data:{FORMAT_MEDIA_TYPES[format]};base64,{base64.b64encode(data).decode()}"
+
+
+def file_sha256(path: Path) -> str:
+    """Get the SHA-256 hex digest of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def rendition_name(source_sha256: str, profile: str, format: str = "JPEG") -> str:
+    """
+    Get the file name of a prebuilt rendition.
+
+    The name is derived from the source content and the profile parameters,
+    so it changes exactly when the rendition does.
+    """
+    params = profile_params(profile, format)
+    digest = hashlib.sha256(f"{source_sha256}\x1f{params!r}".encode()).hexdigest()[:32]
+    return f"{digest[:2]}/{digest}{FORMAT_EXTENSIONS[format]}"
+
+
+class RenditionManifest:
+    """
+    Index of the renditions prebuilt by build_renditions.py.
+
+    Maps each source image (relative to the images directory) to its
+    content hash and the files of its renditions, per profile and format.
+    A prebuilt rendition is only used while the source still has the
+    recorded content and the profile the recorded parameters; a source
+    whose modification time changed is re-hashed once to tell a touch from
+    an edit.
+
+    Args:
+        directory: Directory of the prebuilt renditions and the manifest
+        images_dir: Directory the manifest's image paths are relative to
+    """
+
+    def __init__(self, directory: str, images_dir: str):
+        self.directory = Path(directory)
+        self.images_dir = os.path.abspath(images_dir)
+        with open(self.directory / MANIFEST_NAME) as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported manifest version {manifest.get('version')}")
+        self.images: Dict[str, Dict[str, Any]] = manifest["images"]
+        # (relative path, mtime, size) -> whether the content is unchanged
+        self._verified: Dict[Tuple[str, int, int], bool] = {}
+
+    @classmethod
+    def load(cls, directory: str = PREBUILT_DIR, images_dir: str = IMAGES_DIR) -> Optional["RenditionManifest"]:
+        """Load the manifest, returning None when none has been built"""
+        try:
+            return cls(directory, images_dir)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring rendition manifest in {directory}: {e}")
+            return None
+
+    def _entry(self, image_path: Path) -> Optional[Dict[str, Any]]:
+        relative = os.path.relpath(os.path.abspath(image_path), self.images_dir)
+        entry = self.images.get(relative.replace(os.sep, "/"))
+        if entry is None:
+            return None
+
+        stat = image_path.stat()
+        if stat.st_size != entry["size"]:
+            return None
+        if stat.st_mtime_ns != entry["mtime_ns"]:
+            key = (relative, stat.st_mtime_ns, stat.st_size)
+            if key not in self._verified:
+                self._verified[key] = file_sha256(image_path) == entry["sha256"]
+            if not self._verified[key]:
+                return None
+        return entry
+
+    def get(self, image_path: Path, profile: str, format: str = "JPEG") -> Optional[bytes]:
+        """
+        Get a prebuilt rendition.
+
+        Args:
+            image_path: Path of the source image
+            profile: Name of the rendition profile
+            format: Output format
+
+        Returns:
+            The encoded rendition, or None if it was not prebuilt for the
+            current image content and profile parameters
+        """
+        try:
+            entry = self._entry(image_path)
+            if entry is None:
+                return None
+            rendition = entry["renditions"].get(profile, {}).get(format)
+            if rendition is None or rendition["params"] != list(profile_params(profile, format)):
+                return None
+            return (self.directory / rendition["file"]).read_bytes()
+        except OSError:
+            return None
@@ -0,0 +1,199 @@
+from typing import Dict, Any, List, Optional, Tuple
+from bisect import bisect_left
+import heapq
+import math
+import re
+
+from indexes import bitmap_to_bytes
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Words too common in product descriptions to help ranking
+STOP_WORDS = frozenset({
+    "a", "an", "and", "any", "at", "for", "in", "it", "of", "on", "or",
+    "says", "that", "the", "to", "with", "variant"
+})
+
+# BM25 parameters: term frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def normalize_term(word: str) -> str:
+    """Reduce a lower-case word to its index term (naive plural stripping)"""
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into index terms.
+
+    Args:
+        text: Text to tokenize
+
+    Returns:
+        List of normalized terms, stop words removed
+    """
+    return [
+        normalize_term(word)
+        for word in _TOKEN.findall(text.lower())
+        if word not in STOP_WORDS
+    ]
+
+
+def product_text(product: Dict[str, Any]) -> str:
+    """Get the searchable text of a product"""
+    return f"{product['description']} {product['graphic']}"
+
+
+class SearchIndex:
+    """
+    Inverted index over product text with BM25 ranking.
+
+    Documents are keyed by catalog position so search results can be
+    combined with the bitmap filter indexes. The index is built once per
+    product table; a reloaded catalog gets a new one.
+
+    Args:
+        products: Products to index, in catalog order
+    """
+
+    def __init__(self, products: List[Dict[str, Any]]):
+        # term -> {position: term frequency}
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.lengths: Dict[int, int] = {}
+        self.total_length = 0
+        for position, product in enumerate(products):
+            terms = tokenize(product_text(product))
+            for term in terms:
+                term_postings = self.postings.setdefault(term, {})
+                term_postings[position] = term_postings.get(position, 0) + 1
+            self.lengths[position] = len(terms)
+            self.total_length += len(terms)
+
+    def search(
+        self,
+        query: str,
+        bitmap: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> Tuple[List[Tuple[int, float]], int]:
+        """
+        Rank documents matching any query term with BM25.
+
+        Args:
+            query: Free-text query
+            bitmap: Only return documents in this bitmap (None for all)
+            limit: Only return the ``limit`` best documents
+
+        Returns:
+            Tuple of (list of (position, score) best first, number of matches).
+            Equal scores keep catalog order.
+        """
+        terms = set(tokenize(query))
+        documents = len(self.lengths)
+        if not terms or not documents:
+            return [], 0
+
+        bits = None if bitmap is None else bitmap_to_bytes(bitmap)
+        average_length = self.total_length / documents
+        scores: Dict[int, float] = {}
+        for term in terms:
+            term_postings = self.postings.get(term)
+            if not term_postings:
+                continue
+            idf = math.log(1 + (documents - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+            for position, frequency in term_postings.items():
+                if bits is not None:
+                    byte = position >> 3
+                    if byte >= len(bits) or not bits[byte] >> (position & 7) & 1:
+                        continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[position] / average_length)
+                scores[position] = scores.get(position, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+        ranked = ((score, -position) for position, score in scores.items())
+        best = heapq.nlargest(limit, ranked) if limit is not None else sorted(ranked, reverse=True)
+        return [(-position, score) for score, position in best], len(scores)
+
+
+# Product fields whose values are offered as search suggestions
+SUGGESTION_FIELDS = ("type", "color", "graphic")
+
+
+class SuggestionIndex:
+    """
+    Prefix index over the type, color and graphic vocabulary.
+
+    Every value is indexed under each of its word starts ("space theme
+    with planets" is found by "spa", "the", "pla", ...) in one sorted
+    array, so a prefix lookup is a binary search plus a walk over the
+    matching keys. Suggestions are ranked by purchase frequency, then by
+    the number of products carrying the value; values that start with the
+    prefix rank above values that only contain a word starting with it.
+
+    Args:
+        products: Products in catalog order
+        users: Users, whose purchase histories weight the suggestions
+    """
+
+    def __init__(self, products: List[Dict[str, Any]], users: List[Dict[str, Any]]):
+        purchases: Dict[str, int] = {}
+        for user in users:
+            for product_id in user.get("purchase_history", []):
+                purchases[product_id] = purchases.get(product_id, 0) + 1
+
+        # (field, value) -> [purchases, products]
+        weights: Dict[Tuple[str, str], List[int]] = {}
+        for product in products:
+            for field in SUGGESTION_FIELDS:
+                weight = weights.setdefault((field, product[field]), [0, 0])
+                weight[0] += purchases.get(product["id"], 0)
+                weight[1] += 1
+
+        self.suggestions: List[Dict[str, Any]] = [
+            {"text": value, "field": field, "purchases": weight[0], "products": weight[1]}
+            for (field, value), weight in weights.items()
+        ]
+        keys = []
+        for suggestion_id, suggestion in enumerate(self.suggestions):
+            text = " ".join(suggestion["text"].lower().split())
+            for match in _TOKEN.finditer(text):
+                keys.append((text[match.start():], suggestion_id, match.start() == 0))
+        keys.sort()
+        self._keys = keys
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Get the most popular values with a word starting with the prefix.
+
+        Args:
+            prefix: Text typed so far
+            limit: Maximum number of suggestions
+
+        Returns:
+            List of suggestions (text, field, purchases, products), best first
+        """
+        prefix = " ".join(prefix.lower().split())
+        if not prefix:
+            return []
+
+        keys = self._keys
+        matched: Dict[int, bool] = {}
+        index = bisect_left(keys, (prefix,))
+        while index < len(keys) and keys[index][0].startswith(prefix):
+            _, suggestion_id, at_start = keys[index]
+            matched[suggestion_id] = matched.get(suggestion_id, False) or at_start
+            index += 1
+
+        suggestions = self.suggestions
+        best = heapq.nlargest(
+            limit, matched.items(),
+            key=lambda item: (
+                item[1],
+                suggestions[item[0]]["purchases"],
+                suggestions[item[0]]["products"],
+                -item[0]
+            )
+        )
+        return [suggestions[suggestion_id] for suggestion_id, _ in best]
@@ -0,0 +1,82 @@
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+import hashlib
+import orjson
+
+
+def encode_json(data: Any) -> bytes:
+    """Encode data as compact JSON bytes"""
+    return orjson.dumps(data)
+
+
+def join_json_array(items: Iterable[bytes]) -> bytes:
+    """Join already encoded JSON values into a JSON array"""
+    return b"[" + b",".join(items) + b"]"
+
+
+class EncodedRecords:
+    """
+    Cache of the JSON encoding of each record in a table.
+
+    Records are projected onto the fields of their response model and
+    encoded once; listings are then built by joining the cached bytes,
+    without re-validating or re-serializing every record per request.
+
+    Args:
+        records: Records of the table, in table order
+        fields: Fields to include in the encoding, in response model order
+        position_of: Function returning the table position of a record
+            (None if the record is not in the table)
+    """
+
+    def __init__(
+        self,
+        records: List[Dict[str, Any]],
+        fields: Tuple[str, ...],
+        position_of: Callable[[Dict[str, Any]], Optional[int]]
+    ):
+        self.records = records
+        self.fields = fields
+        self.position_of = position_of
+        self._encoded: List[Optional[bytes]] = [None] * len(records)
+        self._digests: List[Optional[str]] = [None] * len(records)
+
+    def _project(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        return {field: record[field] for field in self.fields if field in record}
+
+    def get(self, position: int) -> bytes:
+        """Get the encoding of the record at a position"""
+        encoded = self._encoded[position]
+        if encoded is None:
+            encoded = self._encoded[position] = encode_json(self._project(self.records[position]))
+        return encoded
+
+    def record(self, record: Dict[str, Any]) -> bytes:
+        """Get the encoding of a record, from the cache when it belongs to the table"""
+        position = self.position_of(record)
+        if position is not None and self.records[position] is record:
+            return self.get(position)
+        return encode_json(self._project(record))
+
+    def digest(self, record: Dict[str, Any]) -> str:
+        """
+        Get a content digest of a record's encoding.
+
+        The digest only changes when the record does, so it makes a precise
+        per-record ETag that every worker process agrees on.
+        """
+        position = self.position_of(record)
+        if position is not None and self.records[position] is record:
+            digest = self._digests[position]
+            if digest is None:
+                digest = self._digests[position] = hashlib.sha1(self.get(position)).hexdigest()
+            return digest
+        return hashlib.sha1(self.record(record)).hexdigest()
+
+    def array(self, records: Iterable[Dict[str, Any]]) -> bytes:
+        """Encode records as a JSON array"""
+        return join_json_array(self.record(record) for record in records)
+
+    def invalidate(self, position: int):
+        """Drop the cached encoding of a record after it changed"""
+        self._encoded[position] = None
+        self._digests[position] = None
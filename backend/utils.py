@@ -1,15 +1,102 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from pathlib import Path
 import base64
-from PIL import Image
-import io
+import os
 
-def format_product_display(product: Dict[str, Any]) -> Dict[str, Any]:
+from image_cache import RenditionCache
+from renditions import RenditionManifest, render_rendition
+
+# Encoded display images: prebuilt by build_renditions.py, then cached in
+# memory and on disk (RENDITION_CACHE_DIR set to an empty string keeps
+# them in memory only; RENDITION_DISK_CACHE_BYTES set to 0 lifts the
+# disk tier's size limit)
+rendition_cache = RenditionCache(
+    directory=os.environ.get("RENDITION_CACHE_DIR", "../.cache/renditions") or None,
+    max_entries=int(os.environ.get("RENDITION_CACHE_ENTRIES", "512")),
+    max_bytes=int(os.environ.get("RENDITION_CACHE_BYTES", str(128 * 1024 * 1024))),
+    manifest=RenditionManifest.load(),
+    disk_max_bytes=int(os.environ.get("RENDITION_DISK_CACHE_BYTES", str(1024 * 1024 * 1024))) or None
+)
+
+def get_rendition(image_path: Path, profile: str, format: str = "JPEG") -> bytes:
+    """
+    Get an encoded rendition of an image, rendering it only on a cache miss.
+
+    Args:
+        image_path: Path of the source image
+        profile: Name of the rendition profile
+        format: Output format
+
+    Returns:
+        The encoded rendition
+    """
+    return rendition_cache.get_or_render(
+        image_path, profile, lambda: render_rendition(image_path, profile, format), format
+    )
+
+def prefetch_rendition(image_path: Path, profile: str, format: str = "JPEG") -> bool:
+    """
+    Load a rendition into the memory cache ahead of a request for it.
+
+    Returns:
+        False if it was already cached, True if it was loaded or rendered
+    """
+    return rendition_cache.prefetch(
+        image_path, profile, lambda: render_rendition(image_path, profile, format), format
+    )
+
+def encode_display_image(image_path: Path, profile: str) -> str:
+    """
+    Get a base64 encoded JPEG rendition, rendering it only on a cache miss.
+
+    Args:
+        image_path: Path of the source image
+        profile: Name of the rendition profile
+
+    Returns:
+        Base64 encoded JPEG data
+    """
+    return base64.b64encode(get_rendition(image_path, profile)).decode()
+
+def format_product_fields(product: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Format the product details shown next to its image.
+
+    Args:
+        product: Product dictionary from the database
+
+    Returns:
+        Dictionary with formatted product details, without the image
+    """
+    return {
+        "id": product["id"],
+        "placeholder": product.get("image_placeholder"),
+        "image_url": f"/{product['image_path']}",
+        "description": product["description"],
+        "type": product["type"].title(),
+        "color": product["color"].title(),
+        "graphic": product["graphic"],
+        "variant": product["variant"],
+        "stock": product["stock"],
+        "price": f"${product['price']:.2f}",
+        "created_at": product["created_at"],
+        "stock_status": "Out of Stock" if product["stock"] == 0 else 
+                      "Low Stock" if product["stock"] < 10 else 
+                      "In Stock"
+    }
+
+def format_product_display(
+    product: Dict[str, Any],
+    image_url: Optional[str] = None,
+    image_profile: str = "detail"
+) -> Dict[str, Any]:
     """
     Format product details for display, including image data.
     
     Args:
         product: Product dictionary from the database
+        image_url: URL to return as the image instead of the encoded image data
+        image_profile: Rendition profile of the encoded image ("detail", or "grid" for a thumbnail)
         
     Returns:
         Dictionary with formatted product details and base64 encoded image
@@ -22,36 +109,11 @@ def format_product_display(product: Dict[str, Any]) -> Dict[str, Any]:
                 "error": "Image not found",
                 "product_details": product
             }
-            
-        with Image.open(image_path) as img:
-            # Convert image to RGB if it's not
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Convert to base64
-            buffered = io.BytesIO()
-            img.save(buffered, format="JPEG", quality=100)
-            img_str = base64.b64encode(buffered.getvalue()).decode()
+
+        image = image_url or f"data:image/jpeg;base64,{encode_display_image(image_path, image_profile)}"
             
         # Format product details
-        formatted_product = {
-            "id": product["id"],
-            "image": f"data:image/jpeg;base64,{img_str}",
-            "image_url": f"/{product['image_path']}",
-            "description": product["description"],
-            "type": product["type"].title(),
-            "color": product["color"].title(),
-            "graphic": product["graphic"],
-            "variant": product["variant"],
-            "stock": product["stock"],
-            "price": f"${product['price']:.2f}",
-            "created_at": product["created_at"],
-            "stock_status": "Out of Stock" if product["stock"] == 0 else 
-                          "Low Stock" if product["stock"] < 10 else 
-                          "In Stock"
-        }
-        
-        return formatted_product
+        return {"image": image, **format_product_fields(product)}
         
     except Exception as e:
         return {
@@ -59,11 +121,12 @@ def format_product_display(product: Dict[str, Any]) -> Dict[str, Any]:
             "product_details": product
         }
 
-def format_user_display(user: Dict[str, Any]) -> Dict[str, Any]:
+def format_user_display(user: Dict[str, Any], image_url: Optional[str] = None) -> Dict[str, Any]:
     """
     Format user details for display, including image data.
     Args:
         user: User dictionary from the database
+        image_url: URL to return as the image instead of the encoded image data
     Returns:
         Dictionary with formatted user details and base64 encoded image
     """
@@ -76,19 +139,12 @@ def format_user_display(user: Dict[str, Any]) -> Dict[str, Any]:
                 "user_details": user
             }
 
-        with Image.open(image_path) as img:
-            # Convert image to RGB if it's not
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Convert to base64
-            buffered = io.BytesIO()
-            img.save(buffered, format="JPEG", quality=100)
-            img_str = base64.b64encode(buffered.getvalue()).decode()
+        image = image_url or f"data:image/jpeg;base64,{encode_display_image(image_path, 'avatar')}"
 
         formatted_user = {
             "id": user["id"],
-            "image": f"data:image/jpeg;base64,{img_str}",
+            "image": image,
+            "placeholder": user.get("image_placeholder"),
             "image_url": f"/{user['image_url']}",
             "name": user["name"],
             "description": user["description"],
@@ -5,6 +5,8 @@ import { ProductCard } from '@/components/ProductCard';
 import { ProductDisplay } from '@/types/product';
 import { motion } from 'framer-motion';
 
+const API_URL = 'http://localhost:8000';
+
 export default function Home() {
   const [products, setProducts] = useState<ProductDisplay[]>([]);
   const [loading, setLoading] = useState(true);
@@ -21,17 +23,24 @@ export default function Home() {
 
     const fetchProducts = async () => {
       try {
-        const response = await fetch('http://localhost:8000/products');
-        const data = await response.json();
-        
-        const displayData = await Promise.all(
-          data.map(async (product: any) => {
-            const displayResponse = await fetch(
-              `http://localhost:8000/products/${product.id}/display`
-            );
-            return displayResponse.json();
-          })
-        );
+        // Fetch display data a page at a time instead of one request per
+        // product; images are linked rather than embedded so the browser
+        // loads and caches them itself
+        const displayData: ProductDisplay[] = [];
+        let cursor: string | null = null;
+        do {
+          const params = new URLSearchParams({ image: 'url', limit: '100' });
+          if (cursor) params.set('cursor', cursor);
+          const response = await fetch(`${API_URL}/products/display?${params}`);
+          if (!response.ok) {
+            throw new Error(`Failed to fetch products: ${response.status}`);
+          }
+          const page: ProductDisplay[] = await response.json();
+          displayData.push(
+            ...page.map((product) => ({ ...product, image: product.image && `${API_URL}${product.image}` }))
+          );
+          cursor = response.headers.get('X-Next-Cursor');
+        } while (cursor);
         
         setProducts(displayData);
       } catch (err) {
@@ -2,21 +2,26 @@ import React, { Suspense } from 'react';
 import { notFound } from 'next/navigation';
 import { Badge } from '@/components/ui/badge';
 
-async function getUser(id: string) {
-  const res = await fetch(`http://localhost:8000/users/${id}/display`);
+const API_URL = 'http://localhost:8000';
+
+// Loads the user, purchased products and cart products in one request
+async function getUserPage(id: string) {
+  const res = await fetch(`${API_URL}/users/${id}/page?image=url`);
   if (!res.ok) return null;
   return res.json();
 }
 
 export default async function UserProfilePage({ params }: { params: { id: string } }) {
-  const user = await getUser(params.id);
-  if (!user) return notFound();
+  const page = await getUserPage(params.id);
+  if (!page) return notFound();
+  const user = page.user;
+  const cart = page.cart;
 
   return (
     <div className="max-w-2xl mx-auto py-10 px-4">
       <div className="flex flex-col items-center gap-4">
         <img
-          src={user.image}
+          src={`${API_URL}${user.image}`}
           alt={user.name}
           className="w-80 h-80 rounded-full object-cover border-4 border-primary shadow-lg"
         />
@@ -31,10 +36,20 @@ export default async function UserProfilePage({ params }: { params: { id: string
 
       <div className="mt-8">
         <h2 className="text-xl font-semibold mb-2">Purchase History</h2>
-        {user.purchase_history.length > 0 ? (
-          <ul className="list-disc list-inside text-gray-700">
-            {user.purchase_history.map((pid: string) => (
-              <li key={pid}>Product ID: <span className="font-mono">{pid}</span></li>
+        {page.purchases.length > 0 ? (
+          <ul className="divide-y divide-gray-200 text-gray-700">
+            {page.purchases.map((product: any, idx: number) => (
+              <li key={`${product.id}-${idx}`} className="py-2 flex items-center gap-3">
+                {product.image && (
+                  <img
+                    src={`${API_URL}${product.image}`}
+                    alt={product.description}
+                    className="w-12 h-12 rounded object-cover"
+                  />
+                )}
+                <span className="flex-1">{product.description}</span>
+                <span>{product.price}</span>
+              </li>
             ))}
           </ul>
         ) : (
@@ -44,18 +59,32 @@ export default async function UserProfilePage({ params }: { params: { id: string
 
       <div className="mt-8">
         <h2 className="text-xl font-semibold mb-2">Current Cart</h2>
-        {user.cart_status && user.cart_status.items.length > 0 ? (
+        {cart.items.length > 0 ? (
           <div className="bg-gray-50 rounded-lg p-4 shadow">
             <ul className="divide-y divide-gray-200">
-              {user.cart_status.items.map((item: any, idx: number) => (
-                <li key={idx} className="py-2 flex justify-between">
-                  <span>Product ID: <span className="font-mono">{item.product_id}</span></span>
+              {cart.items.map((item: any, idx: number) => (
+                <li key={idx} className="py-2 flex items-center gap-3">
+                  {item.product ? (
+                    <>
+                      {item.product.image && (
+                        <img
+                          src={`${API_URL}${item.product.image}`}
+                          alt={item.product.description}
+                          className="w-12 h-12 rounded object-cover"
+                        />
+                      )}
+                      <span className="flex-1">{item.product.description}</span>
+                      <span>{item.product.price}</span>
+                    </>
+                  ) : (
+                    <span className="flex-1">Product ID: <span className="font-mono">{item.product_id}</span></span>
+                  )}
                   <span>Qty: {item.quantity}</span>
                 </li>
               ))}
             </ul>
             <div className="mt-2 text-right font-semibold">
-              Total: ${user.cart_status.total_price.toFixed(2)}
+              Total: ${cart.total_price.toFixed(2)}
             </div>
           </div>
         ) : (
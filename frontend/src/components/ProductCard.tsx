@@ -27,12 +27,18 @@ export function ProductCard({ product }: ProductCardProps) {
 
   return (
     <Card className="overflow-hidden">
-      <div className="aspect-square relative">
-        <img
-          src={product.image}
-          alt={product.description}
-          className="object-cover w-full h-full"
-        />
+      <div
+        className="aspect-square relative bg-cover bg-center"
+        style={product.placeholder ? { backgroundImage: `url(${product.placeholder})` } : undefined}
+      >
+        {product.image && (
+          <img
+            src={product.image}
+            alt={product.description}
+            loading="lazy"
+            className="object-cover w-full h-full"
+          />
+        )}
       </div>
       <CardHeader>
         <CardTitle className="line-clamp-2">{product.description}</CardTitle>
@@ -1,6 +1,7 @@
 export interface ProductDisplay {
   id: string;
-  image: string;
+  image: string | null;
+  placeholder?: string | null;
   description: string;
   type: string;
   color: string;